@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+answer_cache.py
+Semantic answer cache for the chat UI: paraphrased prompts reuse a stored response,
+but only while the evidence behind it is still what retrieval returns (GroundedCache-style gate)
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# FAISS's SIMD inner-product scan is optional; without it the cache_kernels scan is used
+try:
+    import faiss
+    faiss.omp_set_num_threads(1)  # One lookup per request: SIMD only, no thread fan-out
+except ImportError:
+    faiss = None
+
+from cache_kernels import cosine_top1, evidence_signature, jaccard, versions_changed, warmup
+
+logger = logging.getLogger(__name__)
+
+class SemanticLSHIndex:
+    """Random-hyperplane LSH over unit vectors, so a lookup only scores rows sharing a bucket
+
+    With 12 tables of 16 bits, a pair at cosine 0.95 (~18 degrees) collides in at least one
+    table ~91% of the time; memory is 12 row ids per entry next to a 6KB fp32 embedding.
+    """
+
+    def __init__(self, tables: int = 12, bits: int = 16, seed: int = 0):
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self._planes: Optional[np.ndarray] = None  # (tables, bits, dim), drawn on first add
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+    def _codes(self, vector: np.ndarray) -> np.ndarray:
+        """One packed bit-code per table: the sign of the vector against each hyperplane"""
+        return np.packbits(self._planes @ vector > 0, axis=1)
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        if self._planes is None:
+            # Fixed seed: the same hyperplanes (and buckets) every time the cache is reloaded
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal((self.tables, self.bits, vector.shape[0])).astype(np.float32)
+        for table, code in enumerate(self._codes(vector)):
+            self._buckets.setdefault((table, code.tobytes()), []).append(row)
+
+    def candidates(self, vector: np.ndarray) -> np.ndarray:
+        """Rows sharing a bucket with vector in any table"""
+        if self._planes is None:
+            return np.empty(0, dtype=np.int64)
+        rows = set()
+        for table, code in enumerate(self._codes(vector)):
+            rows.update(self._buckets.get((table, code.tobytes()), ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+@dataclass
+class CacheTable:
+    """Struct-of-arrays cache storage: row i of every field belongs to the same entry"""
+    embeddings: Optional[np.ndarray] = None  # (capacity, dim) unit vectors, allocated on first append
+    created: Optional[np.ndarray] = None  # (capacity,) store timestamps
+    keys: List[str] = field(default_factory=list)
+    responses: List[dict] = field(default_factory=list)
+    signatures: List[np.ndarray] = field(default_factory=list)  # sorted uint64 hashes of the evidence ids
+    versions: List[np.ndarray] = field(default_factory=list)  # evidence versions at store time, same order
+    size: int = 0
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.embeddings[:self.size]
+
+    def append(self, key: str, unit_embedding: np.ndarray, created: float,
+               response: dict, evidence: Dict[str, int]) -> int:
+        """Add an entry and return its row, doubling the arrays when full"""
+        if self.embeddings is None:
+            self.embeddings = np.empty((64, unit_embedding.shape[0]), dtype=np.float32)
+            self.created = np.empty(64, dtype=np.float64)
+        elif self.size == len(self.embeddings):
+            # 2x growth keeps appends amortized O(1)
+            embeddings = np.empty((2 * len(self.embeddings), self.embeddings.shape[1]), dtype=np.float32)
+            embeddings[:self.size] = self.embeddings[:self.size]
+            self.embeddings = embeddings
+            self.created = np.resize(self.created, 2 * len(self.created))
+
+        row = self.size
+        self.embeddings[row] = unit_embedding
+        self.created[row] = created
+        self.keys.append(key)
+        self.responses.append(response)
+        signature, versions = evidence_signature(evidence)
+        self.signatures.append(signature)
+        self.versions.append(versions)
+        self.size += 1
+        return row
+
+    def keep(self, rows: np.ndarray) -> None:
+        """Compact the table down to the given rows, preserving their order"""
+        count = len(rows)
+        self.embeddings[:count] = self.embeddings[rows]
+        self.created[:count] = self.created[rows]
+        self.keys = [self.keys[i] for i in rows]
+        self.responses = [self.responses[i] for i in rows]
+        self.signatures = [self.signatures[i] for i in rows]
+        self.versions = [self.versions[i] for i in rows]
+        self.size = count
+
+class SemanticAnswerCache:
+    """Maps prompts to stored responses by exact hash or embedding similarity, gated on evidence
+
+    A candidate is served only if all gates pass:
+      G1  query cosine similarity >= similarity_threshold (exact repeats pass trivially)
+      G2  Jaccard of the freshly retrieved evidence ids vs the cached ones >= evidence_threshold
+      G3  every shared evidence id still has the version it had when the answer was cached
+
+    With FAISS, the G1 scan moves from an exact IndexFlatIP to an 8-bit scalar-quantized index
+    once QUANTIZE_AFTER entries exist (4x less memory traffic per scan). Quantization can reorder
+    near-ties, so the best RERANK_CANDIDATES are re-scored exactly against the fp32 rows; a true
+    best match only goes missing if it falls outside that shortlist.
+    """
+
+    QUANTIZE_AFTER = 10000
+    RERANK_CANDIDATES = 8
+    # Past this size G1 scores only LSH bucket-mates instead of scanning every entry
+    LSH_AFTER = 100000
+    # Expired entries are dropped in one vectorized sweep every this many stores
+    SWEEP_EVERY = 1000
+
+    def __init__(self, embed_fn: Callable[[str], List[float]],
+                 evidence_fn: Callable[[List[float]], Dict[str, int]], response_type,
+                 db_path: Optional[str] = ".llm_cache.db", similarity_threshold: float = 0.95,
+                 evidence_threshold: float = 0.6, ttl_seconds: Optional[float] = None):
+        self.embed_fn = embed_fn
+        self.evidence_fn = evidence_fn
+        self.response_type = response_type
+        self.similarity_threshold = similarity_threshold
+        self.evidence_threshold = evidence_threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        self._table = CacheTable()
+        self._rows: Dict[str, int] = {}  # key -> table row
+        self._index = None  # FAISS index over the table's embeddings, when available
+        self._quantized = False
+        self._lsh = SemanticLSHIndex()
+        self._stores = 0
+        warmup()
+
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, prompt TEXT, embedding BLOB NOT NULL, response TEXT NOT NULL, created REAL)"
+                )
+                try:
+                    self._db.execute("ALTER TABLE answers ADD COLUMN evidence TEXT")
+                except sqlite3.OperationalError:
+                    pass  # Column already exists
+                self._db.commit()
+                for key, blob, response, evidence, created in self._db.execute(
+                    "SELECT key, embedding, response, evidence, created FROM answers "
+                    "WHERE created >= ? ORDER BY created", (self._cutoff(),)
+                ):
+                    self._append(key, np.frombuffer(blob, dtype=np.float32), json.loads(response),
+                                 json.loads(evidence) if evidence else {}, created)
+                logger.info(f"✅ Answer cache loaded {self._table.size} entries from {db_path}")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Answer cache persistence unavailable, using memory only: {e}")
+                self._db = None
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        return hashlib.blake2b(prompt.strip().encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _cutoff(self) -> float:
+        """Entries created before this timestamp have expired"""
+        return time.time() - self.ttl_seconds if self.ttl_seconds else float("-inf")
+
+    def _append(self, key: str, unit_embedding: np.ndarray, response: dict,
+                evidence: Dict[str, int], created: float) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            self._table.responses[row] = response
+            self._table.signatures[row], self._table.versions[row] = evidence_signature(evidence)
+            self._table.created[row] = created
+            return
+        row = self._table.append(key, unit_embedding, created, response, evidence)
+        self._rows[key] = row
+        self._index_row(row)
+
+    def _index_row(self, row: int) -> None:
+        """Add a table row to the LSH buckets and the FAISS index"""
+        vector = self._table.embeddings[row]
+        self._lsh.add(row, vector)
+        if faiss is not None:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[0])
+            self._index.add(vector[np.newaxis, :])
+            if not self._quantized and self._index.ntotal >= self.QUANTIZE_AFTER:
+                self._quantize()
+
+    def _quantize(self) -> None:
+        """Replace the exact index with an 8-bit scalar quantizer trained on the rows indexed so far"""
+        matrix = self._table.embeddings[:self._index.ntotal]
+        index = faiss.IndexScalarQuantizer(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit,
+                                           faiss.METRIC_INNER_PRODUCT)
+        index.train(matrix[:self.QUANTIZE_AFTER])
+        index.add(matrix)
+        self._index = index
+        self._quantized = True
+        logger.info(f"🗜️ Answer cache index quantized to 8 bits ({index.ntotal} entries)")
+
+    def _sweep(self) -> None:
+        """Drop expired entries from the table, the indexes, and disk"""
+        cutoff = self._cutoff()
+        alive = np.flatnonzero(self._table.created[:self._table.size] >= cutoff)
+        expired = self._table.size - len(alive)
+        if not expired:
+            return
+
+        self._table.keep(alive)
+        # Row numbers changed: rebuild the key map and both indexes over the compacted table
+        self._rows = {key: row for row, key in enumerate(self._table.keys)}
+        self._index, self._quantized, self._lsh = None, False, SemanticLSHIndex()
+        for row in range(self._table.size):
+            self._index_row(row)
+
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM answers WHERE created < ?", (cutoff,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Answer cache sweep failed on disk: {e}")
+        logger.info(f"🧹 Answer cache swept {expired} expired entries")
+
+    def _nearest(self, query: np.ndarray) -> Tuple[int, float]:
+        """Row and cosine similarity of the closest cached prompt"""
+        matrix = self._table.matrix
+        if self._table.size >= self.LSH_AFTER:
+            candidates = self._lsh.candidates(query)
+            if not len(candidates):
+                return -1, -1.0  # No bucket-mates: below any threshold
+            exact = matrix[candidates] @ query
+            best = int(np.argmax(exact))
+            return int(candidates[best]), float(exact[best])
+        
+        if self._index is None:
+            return cosine_top1(query, matrix)
+        
+        if not self._quantized:
+            scores, rows = self._index.search(query[np.newaxis, :], 1)
+            return int(rows[0, 0]), float(scores[0, 0])
+        
+        # Approximate shortlist from the int8 codes, exact fp32 rerank of just those rows
+        _, rows = self._index.search(query[np.newaxis, :], self.RERANK_CANDIDATES)
+        candidates = rows[0][rows[0] >= 0]
+        exact = matrix[candidates] @ query
+        best = int(np.argmax(exact))
+        return int(candidates[best]), float(exact[best])
+
+    def lookup(self, prompt: str, similarity_threshold: Optional[float] = None,
+               evidence_threshold: Optional[float] = None):
+        """Return a cached response for this prompt or a close paraphrase if every gate passes, else None"""
+        if similarity_threshold is None:
+            similarity_threshold = self.similarity_threshold
+        if evidence_threshold is None:
+            evidence_threshold = self.evidence_threshold
+        if not self._table.size:
+            return None
+
+        embedding = self.embed_fn(prompt)
+        query = self._normalize(embedding)
+
+        # G1: exact repeat, or the most similar cached prompt
+        with self._lock:
+            row = self._rows.get(self.key(prompt))
+            if row is None:
+                row, similarity = self._nearest(query)
+                if similarity < similarity_threshold:
+                    return None
+            else:
+                similarity = 1.0
+            if self._table.created[row] < self._cutoff():
+                return None  # Expired, awaiting the next sweep
+            cached_signature = self._table.signatures[row]
+            cached_versions = self._table.versions[row]
+            response = self._table.responses[row]
+
+        # G2/G3: re-run the cheap retrieval step (no LLM call) and compare evidence
+        signature, versions = evidence_signature(self.evidence_fn(embedding))
+        overlap = jaccard(signature, cached_signature)
+        if overlap < evidence_threshold:
+            logger.info(f"🚧 Answer cache candidate rejected: evidence overlap {overlap:.2f}")
+            return None
+        if versions_changed(signature, versions, cached_signature, cached_versions):
+            logger.info("🚧 Answer cache candidate rejected: evidence changed since it was cached")
+            return None
+
+        logger.info(f"⚡ Answer cache hit (similarity {similarity:.3f}, evidence overlap {overlap:.2f})")
+        return self.response_type(**response)
+
+    def store(self, prompt: str, response, evidence: Dict[str, int]) -> None:
+        """Remember a response and the evidence (id -> version) it was generated from, in memory and on disk"""
+        key = self.key(prompt)
+        unit_embedding = self._normalize(self.embed_fn(prompt))
+        data = response.model_dump()
+        created = time.time()
+
+        with self._lock:
+            self._append(key, unit_embedding, data, evidence, created)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO answers (key, prompt, embedding, response, created, evidence) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, prompt, unit_embedding.tobytes(), json.dumps(data), created, json.dumps(evidence))
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Answer cache write failed: {e}")
+
+            self._stores += 1
+            if self.ttl_seconds and self._stores % self.SWEEP_EVERY == 0:
+                self._sweep()
@@ -7,48 +7,35 @@ A complete retrieval augmented generation system for document Q&A
 import os
 import asyncio
 import sys
+import math
 import time
+import uuid
 import logging
-from typing import List, Dict, Optional
+import functools
+from collections import deque
+from typing import List, Dict, Optional, Tuple, BinaryIO, Union, Iterable
 from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 
-# Core dependencies
-import boto3
+# Core dependencies (streamlit, boto3, fastapi and the answer cache's numba/faiss are imported where they're used)
 import chromadb
-from openai import OpenAI
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import streamlit as st
-import PyPDF2
-import io
+from openai import OpenAI, AsyncOpenAI
+import numpy as np
 
 # module to add instead of just breaking sentances, to then get about 
 # 500 lines of text to write a summary of about 50 lines.  10:1 ratio.
 from hierarchical_processor import HierarchicalProcessor
+from embedding_cache import EmbeddingCache
+from embedding_batcher import EmbeddingBatcher
+from query_cache import QueryCache
+from document_store import OriginalTextStore
+from config import config
+from schemas import ChatRequest, ChatResponse, DocumentResponse, StreamingAnswer
+from query_router import QueryRouter
+from pdf_extraction import count_pdf_pages, extract_pdf_page_range
 
-import nltk
 import re
-# Download required NLTK data - Updated for NLTK 3.9.1
-try:
-    nltk.data.find('tokenizers/punkt_tab')
-except LookupError:
-    print("Downloading NLTK punkt_tab data...")
-    nltk.download('punkt_tab')
-
-# Also download punkt for backward compatibility
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    print("Downloading NLTK punkt data...")
-    nltk.download('punkt')
-
-# Download stopwords if needed
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    print("Downloading NLTK stopwords...")
-    nltk.download('stopwords')
 
 # Configure logging
 logging.basicConfig(
@@ -57,57 +44,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configuration
-class Config:
-    """System configuration from environment variables"""
-    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID", "")
-    AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
-    AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
-    S3_BUCKET: str = os.getenv("S3_BUCKET", "")
-    CHROMA_HOST: str = os.getenv("CHROMA_HOST", "localhost")
-    CHROMA_PORT: int = int(os.getenv("CHROMA_PORT", "8002"))
-    
-    @property
-    def s3_enabled(self) -> bool:
-        return bool(self.S3_BUCKET and self.AWS_ACCESS_KEY_ID and self.AWS_SECRET_ACCESS_KEY)
-    
-    @property
-    def openai_enabled(self) -> bool:
-        return bool(self.OPENAI_API_KEY and self.OPENAI_API_KEY.startswith("sk-"))
+# Prompts: invariant instructions live in the system message and stay byte-identical across
+# requests, so OpenAI's automatic prompt cache can reuse the prefix. Per-request text goes last.
+RAG_SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions based on provided context. "
+    "If the context doesn't contain enough information to answer the question, "
+    "say so clearly. Always be accurate and cite the information from the context."
+)
+
+_WORD_RE = re.compile(r'\S+')
 
-config = Config()
+def error_answer(e: BaseException) -> str:
+    """User-facing chat error: the exception class only, since str() of some client errors is slow to build"""
+    return f"Sorry, I encountered an error ({type(e).__name__}). Retrying may help."
 
-# Pydantic models
-class ChatRequest(BaseModel):
-    query: str
-    top_k: int = 15 
+@dataclass
+class ExtractedDoc:
+    """Extracted document text with counts computed once and shared downstream"""
+    text: str
+    char_count: int
+    word_count: int
+    
+    @classmethod
+    def from_text(cls, text: str) -> "ExtractedDoc":
+        # Count words without materializing a list of them
+        return cls(text=text, char_count=len(text), word_count=sum(1 for _ in _WORD_RE.finditer(text)))
 
-class ChatResponse(BaseModel):
-    answer: str
-    sources: List[str]
-    processing_time: float
 
-class DocumentResponse(BaseModel):
-    status: str
-    message: str
-    chunks_created: int = 0
-    processing_time: float = 0.0
+# Precompiled patterns for paragraph splitting and whitespace normalization
+_PARA_RE = re.compile(r'\n\s*\n')
+_WS_RE = re.compile(r'\s+')
 
 
 class LogicalTextSplitter:
     """Enhanced text splitter that respects sentence and paragraph boundaries"""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 100):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 100, use_spacy: bool = False):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         
         # Common abbreviations that shouldn't end sentences
-        self.abbreviations = {
+        self.abbreviations = frozenset({
             'Dr.', 'Mr.', 'Mrs.', 'Ms.', 'Prof.', 'vs.', 'etc.', 
             'i.e.', 'e.g.', 'cf.', 'al.', 'Inc.', 'Ltd.', 'Corp.',
             'St.', 'Ave.', 'Blvd.', 'Dept.', 'Fig.', 'Vol.', 'No.'
-        }
+        })
+        # str.endswith takes a tuple, so the abbreviation check is a single call
+        self._abbrev_tuple = tuple(self.abbreviations)
+        
+        # Sentence end: terminal punctuation not closing an abbreviation, then whitespace and a
+        # capital letter. Python lookbehinds must be fixed-width, so each abbreviation gets its own.
+        not_abbreviation = ''.join(
+            rf'(?<!\b{re.escape(abbrev[:-1])})' for abbrev in sorted(self.abbreviations)
+        )
+        self._sent_boundary_re = re.compile(not_abbreviation + r'[.!?]+(?=\s+[A-Z])')
+        
+        # Optional rule-based spaCy sentencizer for higher accuracy
+        self._nlp = None
+        if use_spacy:
+            try:
+                import spacy
+                self._nlp = spacy.blank("en")
+                self._nlp.add_pipe("sentencizer")
+            except ImportError:
+                logger.warning("⚠️ spaCy not installed, using regex sentence splitting")
     
     def split_text(self, text: str) -> List[str]:
         """Split text into logical chunks that respect sentence boundaries"""
@@ -124,20 +124,30 @@ class LogicalTextSplitter:
     
     def _split_by_paragraphs(self, text: str) -> List[str]:
         """Split text into paragraphs"""
-        paragraphs = re.split(r'\n\s*\n', text.strip())
+        paragraphs = _PARA_RE.split(text.strip())
         
         cleaned_paragraphs = []
         for para in paragraphs:
             para = para.strip()
             if para and len(para) > 20:  # Ignore very short paragraphs
-                para = re.sub(r'\s+', ' ', para)  # Normalize whitespace
+                para = _WS_RE.sub(' ', para)  # Normalize whitespace
                 cleaned_paragraphs.append(para)
         
         return cleaned_paragraphs
     
     def _split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences with better accuracy"""
-        sentences = nltk.sent_tokenize(text)
+        if self._nlp is None:
+            # One C-level scan: boundaries already exclude abbreviations, so no post-processing
+            sentences = []
+            start = 0
+            for match in self._sent_boundary_re.finditer(text):
+                sentences.append(text[start:match.end()].strip())
+                start = match.end()
+            sentences.append(text[start:].strip())
+            return [s for s in sentences if s]
+        
+        sentences = [sent.text for sent in self._nlp(text).sents]
         
         # Post-process to handle abbreviations
         processed_sentences = []
@@ -148,8 +158,7 @@ class LogicalTextSplitter:
             
             # Check if current sentence ends with abbreviation
             if i < len(sentences) - 1:
-                words = current_sentence.split()
-                if words and any(current_sentence.rstrip().endswith(abbrev) for abbrev in self.abbreviations):
+                if current_sentence.rstrip().endswith(self._abbrev_tuple):
                     next_sentence = sentences[i + 1].strip()
                     if next_sentence and next_sentence[0].islower():
                         current_sentence += " " + next_sentence
@@ -167,38 +176,37 @@ class LogicalTextSplitter:
         
         sentences = self._split_into_sentences(paragraph)
         chunks = []
-        current_chunk = ""
+        # Sentences of the chunk being built, and its joined length (with separating spaces)
         current_sentences = []
+        current_len = 0
         
         for sentence in sentences:
-            potential_chunk = current_chunk + " " + sentence if current_chunk else sentence
+            potential_len = current_len + 1 + len(sentence) if current_sentences else len(sentence)
             
-            if len(potential_chunk) > self.chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
+            if potential_len > self.chunk_size and current_sentences:
+                chunks.append(" ".join(current_sentences).strip())
                 
                 # Handle overlap
-                if self.chunk_overlap > 0 and current_sentences:
-                    overlap_text = ""
+                overlap_sentences = []
+                if self.chunk_overlap > 0:
                     overlap_chars = 0
                     
                     for prev_sentence in reversed(current_sentences):
                         if overlap_chars + len(prev_sentence) <= self.chunk_overlap:
-                            overlap_text = prev_sentence + " " + overlap_text if overlap_text else prev_sentence
+                            overlap_sentences.append(prev_sentence)
                             overlap_chars += len(prev_sentence)
                         else:
                             break
-                    
-                    current_chunk = overlap_text + " " + sentence if overlap_text else sentence
-                    current_sentences = [sentence] if not overlap_text else overlap_text.split() + [sentence]
-                else:
-                    current_chunk = sentence
-                    current_sentences = [sentence]
+                    overlap_sentences.reverse()
+                
+                current_sentences = overlap_sentences + [sentence]
+                current_len = sum(len(s) for s in current_sentences) + len(current_sentences) - 1
             else:
-                current_chunk = potential_chunk
                 current_sentences.append(sentence)
+                current_len = potential_len
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        if current_sentences:
+            chunks.append(" ".join(current_sentences).strip())
         
         return chunks
 
@@ -208,6 +216,21 @@ class LogicalTextSplitter:
 class RAGSystem:
     """Main RAG system implementation"""
     
+    # Max rows per collection.add call; larger requests stop paying off on the Chroma server
+    CHROMA_BATCH_SIZE = 250
+    # Max embedding requests in flight at once, to stay inside OpenAI rate limits
+    EMBEDDING_CONCURRENCY = 8
+    # Seconds a caller waits on the shared embedding batcher before giving up
+    EMBEDDING_TIMEOUT = 60
+    # PDFs with more pages than this are extracted across worker processes
+    PDF_PARALLEL_MIN_PAGES = 20
+    # Seconds a get_system_status result is reused before probing again
+    STATUS_CACHE_TTL = 30
+    # Prompt context budget (~1500 tokens); retrieved chunks past it are dropped
+    MAX_CONTEXT_CHARS = 6000
+    # HNSW parameters for new collections: each query explores search_ef candidates
+    HNSW_METADATA = {"hnsw:M": 16, "hnsw:construction_ef": 200, "hnsw:search_ef": 64}
+    
     def __init__(self):
         logger.info("Initializing RAG System...")
         
@@ -215,6 +238,7 @@ class RAGSystem:
         self.s3_client = None
         if config.s3_enabled:
             try:
+                import boto3
                 self.s3_client = boto3.client(
                     's3',
                     aws_access_key_id=config.AWS_ACCESS_KEY_ID,
@@ -228,11 +252,35 @@ class RAGSystem:
         else:
             logger.info("ℹ️ S3 not configured")
         
+        # Worker processes for large PDFs, created on first use
+        self._pdf_pool = None
+        
+        # (timestamp, status) from the last component probe
+        self._status_cache = None
+        
+        # Whether the summary collection has content; checked lazily, reset on ingest
+        self._has_summaries: Optional[bool] = None
+        
         # Initialize ChromaDB with retries
         self.chroma_client = None
         self.collection = None
         self._init_chromadb()
         
+        # Semantic cache of recent answers
+        self.query_cache = QueryCache(self.chroma_client)
+        
+        # Full document texts for hierarchical processing
+        self.original_text_store = None
+        try:
+            self.original_text_store = OriginalTextStore(config.DOCUMENT_STORE_DB)
+            logger.info("✅ Original text store initialized")
+        except Exception as e:
+            logger.warning(f"⚠️ Original text store initialization failed: {e}")
+        
+        # Embedding cache so identical text is never embedded twice
+        self.embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_DB,
+                                              max_memory_entries=config.EMBEDDING_CACHE_MEMORY_ENTRIES)
+        
         # Initialize text splitter
         self.text_splitter = LogicalTextSplitter(
             chunk_size=1000,
@@ -246,15 +294,33 @@ class RAGSystem:
                 # Test connection
                 self.openai_client.models.list()
                 logger.info("✅ OpenAI client initialized")
+                
+                # Chat answers can come from a self-hosted server; embeddings stay on OpenAI
+                if config.LLM_BASE_URL:
+                    self.chat_client = OpenAI(base_url=config.LLM_BASE_URL, api_key=config.OPENAI_API_KEY)
+                    logger.info(f"✅ Chat model {config.CHAT_MODEL} served from {config.LLM_BASE_URL}")
+                else:
+                    self.chat_client = self.openai_client
             except Exception as e:
                 logger.error(f"❌ OpenAI initialization failed: {e}")
                 raise ValueError("OpenAI API key is required. Please set OPENAI_API_KEY environment variable.")
         else:
             raise ValueError("OpenAI API key is required. Please set OPENAI_API_KEY environment variable.")
 
+        # Single query embeddings from concurrent sessions share one API call
+        self.embed_batcher = EmbeddingBatcher.shared("query-embeddings", self._embed_texts)
+
         # Add hierarchical processor
         self.hierarchical_processor = HierarchicalProcessor(self)
         logger.info("✅ Hierarchical processor initialized")
+        
+        # The chat UI's summary search always has the same shape: bind the summary searcher and its
+        # constants directly, skipping search_enhanced's hierarchical_processor/use_summaries branch
+        # (the handler has already checked has_summaries). Built once per RAGSystem, which the
+        # Streamlit app keeps for the whole process (load_rag_system), not on every rerun
+        self.search_top8 = functools.partial(
+            self.hierarchical_processor.search_with_summaries, top_k_summaries=4, top_k_chunks=8
+        )
 
     def _init_chromadb(self) -> None:
         """Initialize ChromaDB with connection retries"""
@@ -273,7 +339,7 @@ class RAGSystem:
                 
                 self.collection = self.chroma_client.get_or_create_collection(
                     name="documents",
-                    metadata={"description": "RAG document collection"}
+                    metadata={"description": "RAG document collection", **self.HNSW_METADATA}
                 )
                 logger.info("✅ ChromaDB server connected")
                 return
@@ -286,29 +352,25 @@ class RAGSystem:
         # Fallback to in-memory client
         logger.info("⚠️ Using in-memory ChromaDB (data will not persist)")
         self.chroma_client = chromadb.Client()
-        self.collection = self.chroma_client.get_or_create_collection("documents")
+        self.collection = self.chroma_client.get_or_create_collection("documents", metadata=self.HNSW_METADATA)
 
 
-    def extract_text(self, file_content: bytes, filename: str) -> str:
-        """Extract text from uploaded files"""
+    def extract_text(self, file_content: Union[bytes, BinaryIO], filename: str) -> ExtractedDoc:
+        """Extract text from uploaded files (bytes or a seekable file object)"""
         file_ext = Path(filename).suffix.lower()
         
         try:
             if file_ext == '.pdf':
-                reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-                text = ""
-                for page_num, page in enumerate(reader.pages):
-                    try:
-                        text += page.extract_text() + "\n"
-                    except Exception as e:
-                        logger.warning(f"Failed to extract text from page {page_num}: {e}")
-                return text.strip()
+                return ExtractedDoc.from_text("\n".join(extract_pdf_page_range(file_content)).strip())
             
             elif file_ext == '.txt':
+                if not isinstance(file_content, bytes):
+                    file_content.seek(0)
+                    file_content = file_content.read()
                 try:
-                    return file_content.decode('utf-8')
+                    return ExtractedDoc.from_text(file_content.decode('utf-8'))
                 except UnicodeDecodeError:
-                    return file_content.decode('utf-8', errors='ignore')
+                    return ExtractedDoc.from_text(file_content.decode('utf-8', errors='ignore'))
             
             else:
                 raise ValueError(f"Unsupported file type: {file_ext}")
@@ -317,55 +379,199 @@ class RAGSystem:
             logger.error(f"Text extraction failed for {filename}: {e}")
             raise
     
+    async def extract_text_async(self, file_content: Union[bytes, BinaryIO], filename: str) -> ExtractedDoc:
+        """Extract text without blocking the event loop, splitting large PDFs across processes"""
+        if Path(filename).suffix.lower() != '.pdf':
+            return self.extract_text(file_content, filename)
+        
+        try:
+            page_count = count_pdf_pages(file_content)
+        except Exception as e:
+            logger.error(f"Text extraction failed for {filename}: {e}")
+            raise
+        
+        if page_count <= self.PDF_PARALLEL_MIN_PAGES:
+            return await asyncio.to_thread(self.extract_text, file_content, filename)
+        
+        if self._pdf_pool is None:
+            self._pdf_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+        
+        # Worker processes need picklable bytes, not a file handle
+        if not isinstance(file_content, bytes):
+            file_content.seek(0)
+            file_content = file_content.read()
+        
+        # One contiguous page range per worker, reassembled in order
+        pages_per_task = math.ceil(page_count / (os.cpu_count() or 1))
+        loop = asyncio.get_running_loop()
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(self._pdf_pool, extract_pdf_page_range,
+                                 file_content, start, start + pages_per_task)
+            for start in range(0, page_count, pages_per_task)
+        ])
+        logger.info(f"📑 Extracted {page_count} pages in {len(parts)} parallel tasks")
+        return ExtractedDoc.from_text("\n".join(page for part in parts for page in part).strip())
+
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI"""
+        text = text[:8191]  # OpenAI embedding limit
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached.tolist()
+        
         try:
-            response = self.openai_client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text[:8191]  # OpenAI embedding limit
-            )
-            return response.data[0].embedding
+            embedding = self.embed_batcher.submit(text).result(timeout=self.EMBEDDING_TIMEOUT)
+            self.embedding_cache.put(text, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             raise
 
-    async def process_document(self, file_content: bytes, filename: str) -> DocumentResponse:
-        """Process uploaded document: extract text, chunk, embed, and store"""
+    async def get_query_embedding(self, text: str) -> List[float]:
+        """get_embedding without blocking the event loop (same cache and shared batcher)"""
+        return await asyncio.to_thread(self.get_embedding, text)
+
+    @staticmethod
+    def _ordered_embeddings(response) -> List[List[float]]:
+        """Embeddings from an embeddings.create response, in input order"""
+        # Results carry their input index; don't rely on response order
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings request for a batch of texts, in input order"""
+        return self._ordered_embeddings(self.openai_client.embeddings.create(
+            model="text-embedding-ada-002",
+            input=texts
+        ))
+
+    async def _embed_one_batch(self, client: AsyncOpenAI, batch: List[str], batch_number: int,
+                               semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """Embed a single batch, retrying with exponential backoff"""
+        async with semaphore:
+            for attempt in range(3):
+                try:
+                    return self._ordered_embeddings(await client.embeddings.create(
+                        model="text-embedding-ada-002",
+                        input=batch
+                    ))
+                except Exception as e:
+                    logger.warning(f"❌ Embedding batch {batch_number} attempt {attempt + 1} failed: {e}")
+                    if attempt < 2:
+                        await asyncio.sleep(2 ** attempt)
+                    else:
+                        logger.error(f"Embedding generation failed: {e}")
+                        raise
+
+    async def get_embeddings_batch(self, texts: List[str], batch_size: int = 96) -> np.ndarray:
+        """Generate a float32 [n, dim] embedding array, sending only cache misses to OpenAI concurrently"""
+        texts = [text[:8191] for text in texts]  # OpenAI embedding limit
+        embeddings = self.embedding_cache.get_many(texts)
+        
+        # Unique texts that still need embedding, in first-seen order
+        misses = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        logger.info(f"🗃️ Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} to embed")
+        if not misses:
+            return np.stack(embeddings)
+        
+        semaphore = asyncio.Semaphore(self.EMBEDDING_CONCURRENCY)
+        batches = [misses[start:start + batch_size] for start in range(0, len(misses), batch_size)]
+        # A client per call: its connection pool is bound to this event loop, and the Streamlit
+        # handler runs each ingest in a fresh asyncio.run() against a process-wide RAGSystem
+        async with AsyncOpenAI(api_key=config.OPENAI_API_KEY) as client:
+            results = await asyncio.gather(*[
+                self._embed_one_batch(client, batch, i, semaphore) for i, batch in enumerate(batches)
+            ])
+        fresh = np.asarray([embedding for batch_embeddings in results for embedding in batch_embeddings],
+                           dtype=np.float32)
+        self.embedding_cache.put_many(misses, fresh)
+        
+        by_text = dict(zip(misses, fresh))
+        return np.stack([embedding if embedding is not None else by_text[text]
+                         for text, embedding in zip(texts, embeddings)])
+
+    def upload_to_s3(self, file_content: Union[bytes, BinaryIO], filename: str) -> None:
+        """Back up the original document to S3 if configured"""
+        if not self.s3_client:
+            return
+        
+        try:
+            if isinstance(file_content, bytes):
+                self.s3_client.put_object(
+                    Bucket=config.S3_BUCKET,
+                    Key=f"documents/{filename}",
+                    Body=file_content,
+                    Metadata={'original_name': filename}
+                )
+            else:
+                # Stream from the file object instead of re-reading it into memory
+                file_content.seek(0)
+                self.s3_client.upload_fileobj(
+                    file_content,
+                    config.S3_BUCKET,
+                    f"documents/{filename}",
+                    ExtraArgs={'Metadata': {'original_name': filename}}
+                )
+            logger.info(f"☁️ Uploaded to S3: {filename}")
+        except Exception as e:
+            logger.warning(f"⚠️ S3 upload failed: {e}")
+
+    def _add_to_collection(self, ids: List[str], embeddings: np.ndarray, documents: List[str],
+                           metadatas: List[Dict], offset: int = 0) -> List[Tuple[int, str]]:
+        """Upsert a batch into the chunk collection, splitting it in half on failure to isolate bad rows
+        
+        Upsert, not add: Chroma ignores add for existing ids, so a re-ingested file would keep
+        its old rows (and versions). Returns (chunk_index, error) for each row that could not
+        be stored; offset is the chunk index of the batch's first row.
+        """
+        try:
+            self.collection.upsert(
+                ids=ids,
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+            return []
+        except Exception as e:
+            if len(ids) == 1:
+                logger.error(f"Failed to store chunk {ids[0]}: {e}")
+                return [(offset, str(e))]
+            
+            mid = len(ids) // 2
+            return (
+                self._add_to_collection(ids[:mid], embeddings[:mid], documents[:mid], metadatas[:mid], offset) +
+                self._add_to_collection(ids[mid:], embeddings[mid:], documents[mid:], metadatas[mid:], offset + mid)
+            )
+
+    async def process_document(self, file_content: Union[bytes, BinaryIO], filename: str) -> DocumentResponse:
+        """Process uploaded document: extract text, chunk, embed, and store
+        
+        file_content may be raw bytes or a seekable file object, which is read in place.
+        """
         start_time = time.time()
         
         try:
             logger.info(f"📄 Processing document: {filename}")
             
             # Extract text
-            text = self.extract_text(file_content, filename)
-            if not text.strip():
+            doc = await self.extract_text_async(file_content, filename)
+            text = doc.text
+            if not doc.word_count:
                 return DocumentResponse(
                     status="error",
                     message="No text content found in document",
                     processing_time=time.time() - start_time
                 )
             
-            logger.info(f"📝 Extracted {len(text)} characters")
+            logger.info(f"📝 Extracted {doc.char_count} characters ({doc.word_count} words)")
             
             # Store original text for hierarchical processing
-            self.store_original_text(text, filename)
-            
-            # Upload to S3 if configured
-            if self.s3_client:
-                try:
-                    self.s3_client.put_object(
-                        Bucket=config.S3_BUCKET,
-                        Key=f"documents/{filename}",
-                        Body=file_content,
-                        Metadata={'original_name': filename}
-                    )
-                    logger.info(f"☁️ Uploaded to S3: {filename}")
-                except Exception as e:
-                    logger.warning(f"⚠️ S3 upload failed: {e}")
+            self.store_original_text(doc, filename)
             
             # Chunk text using LogicalTextSplitter
             chunks = self.text_splitter.split_text(text)
             if not chunks:
+                # Keep the S3 backup even when there is nothing to embed
+                await asyncio.to_thread(self.upload_to_s3, file_content, filename)
                 return DocumentResponse(
                     status="error",
                     message="Failed to create text chunks",
@@ -374,36 +580,57 @@ class RAGSystem:
             
             logger.info(f"✂️ Created {len(chunks)} logical chunks")
             
-            # Generate embeddings and store
-            for i, chunk in enumerate(chunks):
-                try:
-                    embedding = self.get_embedding(chunk)
-                    chunk_id = f"{filename}_{i}"
-                    
-                    self.collection.add(
-                        ids=[chunk_id],
-                        embeddings=[embedding],
-                        documents=[chunk],
-                        metadatas=[{
-                            "filename": filename,
-                            "chunk_index": i,
-                            "total_chunks": len(chunks),
-                            "chunk_size": len(chunk),
-                            "chunking_method": "logical"
-                        }]
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to process chunk {i}: {e}")
-                    continue
+            # Generate embeddings while the S3 upload runs in the background
+            embeddings, _ = await asyncio.gather(
+                self.get_embeddings_batch(chunks),
+                asyncio.to_thread(self.upload_to_s3, file_content, filename)
+            )
+            logger.info(f"🔢 Generated {len(embeddings)} embeddings")
+            
+            ids = [f"{filename}_{i}" for i in range(len(chunks))]
+            version = int(start_time)  # Lets cached answers detect re-ingested evidence
+            metadatas = [{
+                "filename": filename,
+                "chunk_index": i,
+                "total_chunks": len(chunks),
+                "chunk_size": len(chunk),
+                "chunking_method": "logical",
+                "version": version
+            } for i, chunk in enumerate(chunks)]
+            
+            failed_chunks = []
+            for start in range(0, len(chunks), self.CHROMA_BATCH_SIZE):
+                end = start + self.CHROMA_BATCH_SIZE
+                failed_chunks += self._add_to_collection(
+                    ids[start:end], embeddings[start:end], chunks[start:end], metadatas[start:end], start
+                )
+            stored = len(chunks) - len(failed_chunks)
+            logger.info(f"💾 Stored {stored}/{len(chunks)} chunks in ChromaDB")
+            
+            # A re-ingested file with fewer chunks leaves its old trailing ids behind, and a row that
+            # failed to upsert leaves the previous version under its id; drop both
+            try:
+                self.collection.delete(where={"$and": [
+                    {"filename": filename}, {"chunk_index": {"$gte": len(chunks)}}
+                ]})
+                if failed_chunks:
+                    self.collection.delete(ids=[ids[i] for i, _ in failed_chunks])
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to remove stale chunks of {filename}: {e}")
+            
+            # Cached answers were built from the old corpus
+            self.query_cache.clear()
             
             processing_time = time.time() - start_time
             logger.info(f"✅ Successfully processed {filename} in {processing_time:.2f}s using logical chunking")
             
             return DocumentResponse(
                 status="success",
-                message=f"Successfully processed {len(chunks)} logical chunks",
-                chunks_created=len(chunks),
-                processing_time=processing_time
+                message=f"Successfully processed {stored} logical chunks" +
+                        (f" ({len(failed_chunks)} failed)" if failed_chunks else ""),
+                chunks_created=stored,
+                processing_time=processing_time,
+                failed_chunks=failed_chunks
             )
             
         except Exception as e:
@@ -414,8 +641,93 @@ class RAGSystem:
                 processing_time=time.time() - start_time
             )
     
-    def search_and_answer(self, query: str, top_k: int = 3) -> ChatResponse:
-        """Search documents and generate answer using RAG"""
+    def select_context(self, chunks: List[str], max_chars: Optional[int] = None) -> List[int]:
+        """Pick indices of chunks, in relevance order, that fit the context budget
+        
+        Chunks whose first 200 characters match an already selected chunk are skipped,
+        since retrieval often returns overlapping passages.
+        """
+        max_chars = max_chars or self.MAX_CONTEXT_CHARS
+        selected = []
+        seen = set()
+        used = 0
+        
+        for i, chunk in enumerate(chunks):
+            key = hash(chunk[:200])
+            if key in seen:
+                continue
+            
+            cost = len(chunk) + (2 if selected else 0)  # "\n\n" separator
+            if selected and used + cost > max_chars:
+                break
+            
+            seen.add(key)
+            selected.append(i)
+            used += cost
+        
+        return selected
+
+    @property
+    def has_summaries(self) -> bool:
+        """Whether summaries exist, so chat can use summary-enhanced search"""
+        if self._has_summaries is None:
+            collection = self.hierarchical_processor.summary_collection
+            try:
+                self._has_summaries = bool(collection and collection.count())
+            except Exception as e:
+                logger.warning(f"⚠️ Summary count failed: {e}")
+                self._has_summaries = bool(collection)
+        return self._has_summaries
+
+    def invalidate_has_summaries(self) -> None:
+        """Re-check for summaries on next access (after ingest or a reindex)"""
+        self._has_summaries = None
+
+    @staticmethod
+    def context_blocks(results: Dict, indices: List[int], position_field: str = "chunk_index") -> str:
+        """Join the chosen hits in a stable (filename, position) order, each tagged with its block id
+        
+        Relevance order changes from query to query; a canonical order keeps the context
+        byte-identical whenever two queries retrieve the same blocks, so the prompt prefix is reusable.
+        position_field must be numeric; rows missing it sort first.
+        """
+        ids, documents, metadatas = results['ids'][0], results['documents'][0], results['metadatas'][0]
+        ordered = sorted(indices, key=lambda i: (metadatas[i].get("filename", ""), metadatas[i].get(position_field, 0)))
+        return "\n\n".join(f"[{ids[i]}]\n{documents[i]}" for i in ordered)
+
+    @staticmethod
+    def result_evidence(results: Dict, indices: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Ids and versions of the given hits (all of them by default) in a Chroma query result"""
+        ids, metadatas = results['ids'][0], results['metadatas'][0]
+        if indices is None:
+            indices = range(len(ids))
+        return {ids[i]: (metadatas[i] or {}).get("version", 0) for i in indices}
+
+    @staticmethod
+    def answer_messages(system_prompt: str, context: str, query: str,
+                        history_summary: Optional[str] = None) -> List[Dict[str, str]]:
+        """Chat messages for one answer: static system prompt first, then the optional
+        compact summary of earlier turns, then this turn's context and question"""
+        messages = [{"role": "system", "content": system_prompt}]
+        if history_summary:
+            messages.append({"role": "system", "content": f"Earlier conversation (summary):\n{history_summary}"})
+        messages.append({"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"})
+        return messages
+
+    @staticmethod
+    def session_headers(session_id: Optional[str]) -> Optional[Dict[str, str]]:
+        """Per-session header so a prefix-caching server can keep this conversation's KV blocks warm"""
+        return {"X-Session-ID": session_id} if session_id else None
+
+    def search_and_answer(self, query: str, top_k: int = 3, session_id: Optional[str] = None,
+                          stream: bool = False, history_summary: Optional[str] = None,
+                          use_query_cache: bool = True) -> Union[ChatResponse, StreamingAnswer]:
+        """Search documents and generate answer using RAG
+        
+        With stream=True a generated answer comes back as a StreamingAnswer; cached and
+        "no documents" answers are still returned whole. use_query_cache=False skips the
+        ungated query cache, for callers that sit behind the evidence-gated answer cache.
+        """
         start_time = time.time()
         
         try:
@@ -424,6 +736,18 @@ class RAGSystem:
             # Generate query embedding
             query_embedding = self.get_embedding(query)
             
+            # Reuse the answer to a semantically identical recent query. The cache is shared by all
+            # sessions, so answers conditioned on one session's history neither read nor write it
+            use_cache = use_query_cache and not history_summary
+            cached = self.query_cache.lookup(query_embedding, top_k) if use_cache else None
+            if cached:
+                answer, sources = cached
+                return ChatResponse(
+                    answer=answer,
+                    sources=sources,
+                    processing_time=time.time() - start_time
+                )
+            
             # Search for relevant chunks
             results = self.collection.query(
                 query_embeddings=[query_embedding],
@@ -437,92 +761,173 @@ class RAGSystem:
                     processing_time=time.time() - start_time
                 )
             
-            # Prepare context
-            context_chunks = results['documents'][0]
-            context = "\n\n".join(context_chunks)
-            sources = [meta["filename"] for meta in results['metadatas'][0]]
-            
-            logger.info(f"📚 Found {len(context_chunks)} relevant chunks from {len(set(sources))} documents")
-            
-            # Generate answer using OpenAI
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful assistant that answers questions based on provided context. "
-                                 "If the context doesn't contain enough information to answer the question, "
-                                 "say so clearly. Always be accurate and cite the information from the context."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
-                    }
-                ],
+            # Prepare context within the prompt budget
+            selected = self.select_context(results['documents'][0])
+            context = self.context_blocks(results, selected)
+            # Deduplicate in one pass, keeping the order of first (most relevant) appearance
+            sources = list(dict.fromkeys(results['metadatas'][0][i]["filename"] for i in selected))
+            
+            logger.info(f"📚 Using {len(selected)}/{len(results['documents'][0])} relevant chunks "
+                        f"({len(context)} chars) from {len(sources)} documents")
+            
+            # Generate answer; the chat history is never re-sent, at most a bounded summary of it
+            response = self.chat_client.chat.completions.create(
+                model=config.CHAT_MODEL,
+                messages=self.answer_messages(RAG_SYSTEM_PROMPT, context, query, history_summary),
                 temperature=0.1,
-                max_tokens=1000
+                max_tokens=1000,
+                extra_headers=self.session_headers(session_id),
+                stream=stream
             )
             
+            evidence = self.result_evidence(results, selected)
+            
+            if stream:
+                on_complete = None
+                if use_cache:
+                    on_complete = lambda answer: self.query_cache.store(query, query_embedding, top_k, answer, sources)
+                return StreamingAnswer(
+                    chunks=response,
+                    sources=sources,
+                    start_time=start_time,
+                    evidence=evidence,
+                    on_complete=on_complete
+                )
+            
             answer = response.choices[0].message.content
             processing_time = time.time() - start_time
             
             logger.info(f"💬 Generated answer in {processing_time:.2f}s")
             
+            if use_cache:
+                self.query_cache.store(query, query_embedding, top_k, answer, sources)
+            
             return ChatResponse(
                 answer=answer,
-                sources=list(set(sources)),  # Remove duplicates
-                processing_time=processing_time
+                sources=sources,
+                processing_time=processing_time,
+                evidence=evidence
             )
             
         except Exception as e:
-            logger.error(f"Search and answer failed: {e}")
+            logger.exception("Search and answer failed")
             return ChatResponse(
-                answer=f"Sorry, I encountered an error: {str(e)}",
+                answer=error_answer(e),
                 sources=[],
                 processing_time=time.time() - start_time
             )
    
+    def vector_search(self, collection, query_embedding: List[float], top_k: int = 8) -> Tuple[Dict, float]:
+        """Top-k hits of one HNSW query, plus its duration
+        
+        The collection's hnsw:search_ef (64) is the wide candidate stage, run inside Chroma;
+        only the top_k hits (no embeddings) come back over the wire, already in exact-distance order.
+        """
+        search_start = time.time()
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            include=["documents", "metadatas"]
+        )
+        return results, time.time() - search_start
+
+    def quick_answer(self, query: str) -> Optional[ChatResponse]:
+        """Answer with the single best-matching chunk, without an LLM call"""
+        start_time = time.time()
+        try:
+            results = self.collection.query(
+                query_embeddings=[self.get_embedding(query)],
+                n_results=1
+            )
+            if not results['documents'][0]:
+                return None
+            return ChatResponse(
+                answer=results['documents'][0][0],
+                sources=[results['metadatas'][0][0]["filename"]],
+                processing_time=time.time() - start_time
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Quick answer failed, using the LLM: {e}")
+            return None
+
+    def retrieve_evidence(self, query_embedding: List[float], top_k: int = 8,
+                          top_k_summaries: int = 4) -> Dict[str, int]:
+        """Ids and versions of the chunks and summaries a chat answer would use (no LLM call)
+        
+        Mirrors the chat retrieval: the top_k chunks trimmed by select_context, plus the top
+        summaries, so it matches the evidence recorded on a freshly generated answer.
+        """
+        evidence = {}
+        try:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=top_k,
+                include=["documents", "metadatas"]
+            )
+            evidence.update(self.result_evidence(results, self.select_context(results['documents'][0])))
+        except Exception as e:
+            logger.warning(f"⚠️ Evidence retrieval failed: {e}")
+        
+        summary_collection = self.hierarchical_processor.summary_collection
+        if summary_collection:
+            try:
+                results = summary_collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k_summaries,
+                    include=["metadatas"]
+                )
+                evidence.update(self.result_evidence(results))
+            except Exception as e:
+                logger.warning(f"⚠️ Summary evidence retrieval failed: {e}")
+        
+        return evidence
+
     # Enhanced search method for RAGSystem class:
-    def search_enhanced(self, query: str, top_k: int = 5, use_summaries: bool = True):
+    async def search_enhanced(self, query: str, top_k: int = 8, use_summaries: bool = True,
+                              session_id: Optional[str] = None, stream: bool = False,
+                              history_summary: Optional[str] = None):
         """Enhanced search that can use both chunks and summaries"""
         
         if hasattr(self, 'hierarchical_processor') and use_summaries:
-            return self.hierarchical_processor.search_with_summaries(query, top_k_summaries=5, top_k_chunks=top_k)
+            return await self.hierarchical_processor.search_with_summaries(
+                query, top_k_summaries=4, top_k_chunks=top_k,
+                session_id=session_id, stream=stream, history_summary=history_summary
+            )
         else:
-            return self.search_and_answer(query, top_k)
+            return await asyncio.to_thread(
+                self.search_and_answer, query, top_k,
+                session_id=session_id, stream=stream, history_summary=history_summary,
+                use_query_cache=False
+            )
 
-    def store_original_text(self, text: str, filename: str):
+    def store_original_text(self, doc: ExtractedDoc, filename: str):
             """Store original document text for later hierarchical processing"""
+            if not self.original_text_store:
+                return
+            
             try:
-                # Create or get original text collection
-                text_collection = self.chroma_client.get_or_create_collection(
-                    name="original_texts",
-                    metadata={"description": "Original document texts for hierarchical processing"}
-                )
-                
-                # Store the full text
-                # Use a simple embedding of the filename for storage
-                simple_embedding = [0.0] * 1536  # Dummy embedding for storage
-                
-                text_collection.add(
-                    ids=[f"fulltext_{filename}"],
-                    embeddings=[simple_embedding],
-                    documents=[text],
-                    metadatas=[{
-                        "filename": filename,
-                        "content_type": "original_text",
-                        "character_count": len(text),
-                        "word_count": len(text.split())
-                    }]
-                )
-                
+                self.original_text_store.save(filename, doc.text, doc.char_count, doc.word_count)
                 logger.info(f"✅ Stored original text for {filename}")
                 
             except Exception as e:
                 logger.error(f"Failed to store original text: {e}")
 
+    def get_original_text(self, filename: str) -> Optional[str]:
+        """Return the stored full text of a document, if available"""
+        if not self.original_text_store:
+            return None
+        
+        try:
+            return self.original_text_store.get(filename)
+        except Exception as e:
+            logger.error(f"Failed to read original text: {e}")
+            return None
+
     def get_system_status(self) -> Dict:
-        """Get system component status"""
+        """Get system component status, cached for STATUS_CACHE_TTL seconds"""
+        if self._status_cache and time.time() - self._status_cache[0] < self.STATUS_CACHE_TTL:
+            return dict(self._status_cache[1])
+        
         status = {
             "chromadb": "disconnected",
             "openai": "disconnected",
@@ -539,10 +944,10 @@ class RAGSystem:
         except:
             status["chromadb"] = "disconnected"
         
-        # Check OpenAI
+        # Check OpenAI with a small authenticated request rather than listing every model
         if config.openai_enabled:
             try:
-                self.openai_client.models.list()
+                self.openai_client.with_options(timeout=2).models.retrieve("text-embedding-ada-002")
                 status["openai"] = "connected"
             except:
                 status["openai"] = "error"
@@ -555,85 +960,136 @@ class RAGSystem:
             except:
                 status["s3"] = "error"
         
-        return status
+        self._status_cache = (time.time(), status)
+        return dict(status)
 
-# Initialize RAG system
-rag_system = RAGSystem()
+# RAG system, created on first use. The Streamlit app keeps its own in st.cache_resource instead:
+# Streamlit re-executes this script (and would rebuild a module-level instance) on every interaction
+_rag_system: Optional[RAGSystem] = None
 
-# FastAPI Application
-app = FastAPI(
-    title="RAG Document Chat API",
-    description="Retrieval Augmented Generation system for document Q&A",
-    version="1.0.0"
-)
+def get_rag_system() -> RAGSystem:
+    """The process-wide RAGSystem for the API server and scripts"""
+    global _rag_system
+    if _rag_system is None:
+        _rag_system = RAGSystem()
+    return _rag_system
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# FastAPI Application, built only when the API is served (Streamlit reruns never import FastAPI)
+def _build_api():
+    """Create the FastAPI app and its routes"""
+    from fastapi import FastAPI, UploadFile, File, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    
+    rag_system = get_rag_system()
+    app = FastAPI(
+        title="RAG Document Chat API",
+        description="Retrieval Augmented Generation system for document Q&A",
+        version="1.0.0"
+    )
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
-@app.get("/")
-async def root():
-    """Health check endpoint"""
-    return {
-        "message": "RAG Document Chat API is running!",
-        "status": rag_system.get_system_status()
-    }
-
-@app.post("/upload", response_model=DocumentResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a document"""
-    try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No filename provided")
-        
-        if not file.filename.lower().endswith(('.pdf', '.txt')):
-            raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
-        
-        # Read file content
-        content = await file.read()
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="Empty file")
-        
-        # Process document
-        result = await rag_system.process_document(content, file.filename)
-        return result
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Upload endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_documents(request: ChatRequest):
-    """Ask questions about uploaded documents"""
-    try:
-        if not request.query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
-        
-        result = rag_system.search_and_answer(request.query, request.top_k)
-        return result
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Chat endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/status")
-async def get_status():
-    """Get system status"""
-    return rag_system.get_system_status()
+    @app.get("/")
+    async def root():
+        """Health check endpoint"""
+        return {
+            "message": "RAG Document Chat API is running!",
+            "status": rag_system.get_system_status()
+        }
+
+    @app.post("/upload", response_model=DocumentResponse)
+    async def upload_document(file: UploadFile = File(...)):
+        """Upload and process a document"""
+        try:
+            # Validate file
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="No filename provided")
+            
+            if not file.filename.lower().endswith(('.pdf', '.txt')):
+                raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
+            
+            # Check size without reading the upload into memory
+            file.file.seek(0, os.SEEK_END)
+            if file.file.tell() == 0:
+                raise HTTPException(status_code=400, detail="Empty file")
+            file.file.seek(0)
+            
+            # Process document straight from the spooled upload file
+            result = await rag_system.process_document(file.file, file.filename)
+            return result
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Upload endpoint error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat_with_documents(request: ChatRequest):
+        """Ask questions about uploaded documents"""
+        try:
+            if not request.query.strip():
+                raise HTTPException(status_code=400, detail="Query cannot be empty")
+            
+            result = rag_system.search_and_answer(request.query, request.top_k)
+            return result
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Chat endpoint error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @app.get("/status")
+    async def get_status():
+        """Get system status"""
+        return rag_system.get_system_status()
+    
+    return app
+
+def __getattr__(name: str):
+    """Keep `uvicorn app:app` and `from app import app, rag_system` working by building them on first access"""
+    if name == "app":
+        globals()["app"] = _build_api()
+        return globals()["app"]
+    if name == "rag_system":
+        return get_rag_system()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Streamlit Interface
+def format_sources(sources: List[str]) -> str:
+    """Render a sources list as one Markdown string (one frontend update instead of one per source)"""
+    # One vectorized prefix test instead of a Python-level startswith per source
+    names = np.asarray(sources, dtype=str)
+    is_summary = np.char.startswith(names, "Summary:")
+    lines = np.where(is_summary, np.char.add("🧠 ", names), np.char.add(np.char.add("📄 `", names), "`"))
+    # Trailing double space forces a Markdown line break between entries
+    return "  \n".join(lines.tolist())
+
+# Chat turns kept (and re-rendered) per session; older turns fold into a bounded text summary
+CHAT_HISTORY_MESSAGES = 40
+HISTORY_SUMMARY_CHARS = 2000
+
+def remember_message(session_state, message: Dict) -> None:
+    """Append to the bounded chat history, folding the message it evicts into the rolling summary"""
+    history = session_state.messages
+    if len(history) == history.maxlen:
+        evicted = history[0]
+        summary = f"{session_state.summary_buffer}\n{evicted['role']}: {evicted['content'][:200]}"
+        session_state.summary_buffer = summary[-HISTORY_SUMMARY_CHARS:].lstrip()
+    history.append(message)
+
 def create_streamlit_app():
     """Create Streamlit web interface"""
+    import streamlit as st
+    from answer_cache import SemanticAnswerCache
     
     st.set_page_config(
         page_title="RAG Document Chat",
@@ -642,6 +1098,36 @@ def create_streamlit_app():
         initial_sidebar_state="expanded"
     )
     
+    # Streamlit re-executes this script on every interaction; build the RAG system (and with it
+    # the has_summaries memo and search_top8) and the answer cache once per process
+    @st.cache_resource
+    def load_rag_system():
+        return RAGSystem()
+    
+    rag_system = load_rag_system()
+    
+    @st.cache_resource
+    def load_answer_cache(_embed_fn, _evidence_fn):
+        return SemanticAnswerCache(_embed_fn, _evidence_fn, ChatResponse, config.ANSWER_CACHE_DB,
+                                   ttl_seconds=config.ANSWER_CACHE_TTL)
+    
+    answer_cache = load_answer_cache(rag_system.get_embedding, rag_system.retrieve_evidence)
+    
+    @st.cache_resource
+    def load_query_router():
+        return QueryRouter(config.QUERY_ROUTER_MODEL)
+    
+    query_router = load_query_router()
+    
+    # Answer cache gate thresholds, tunable per session
+    with st.sidebar:
+        st.subheader("⚡ Answer Cache")
+        query_threshold = st.slider("Query similarity (τ_q)", 0.80, 1.00, answer_cache.similarity_threshold, 0.01)
+        evidence_threshold = st.slider("Evidence overlap (τ_e)", 0.0, 1.0, answer_cache.evidence_threshold, 0.05)
+        if st.button("🔄 Reindex", help="Re-check which collections have content"):
+            rag_system.invalidate_has_summaries()
+        st.checkbox("🐞 Show error details", key="debug")
+    
     st.title("📚 RAG Document Chat System")
     st.markdown("Upload documents and chat with them using AI!")
 
@@ -664,7 +1150,7 @@ def create_streamlit_app():
                 with st.spinner("Creating logical chunks..."):
                     try:
                         result = asyncio.run(rag_system.process_document(
-                            uploaded_file.read(), uploaded_file.name
+                            uploaded_file, uploaded_file.name
                         ))
                         
                         if result.status == "success":
@@ -761,7 +1247,11 @@ def create_streamlit_app():
     
     # Initialize chat history
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = deque(maxlen=CHAT_HISTORY_MESSAGES)
+        st.session_state.summary_buffer = ""
+    # Stable per-browser-session id, sent to the chat server for prefix-cache affinity
+    if "sid" not in st.session_state:
+        st.session_state.sid = uuid.uuid4().hex
     
     # Display chat history
     for message in st.session_state.messages:
@@ -771,13 +1261,12 @@ def create_streamlit_app():
             # Show sources for assistant messages
             if message["role"] == "assistant" and "sources" in message and message["sources"]:
                 with st.expander("📚 Sources", expanded=False):
-                    for source in message["sources"]:
-                        st.text(f"• {source}")
+                    st.markdown(format_sources(message["sources"]))
     
     # Chat input
     if prompt := st.chat_input("Ask a question about your documents..."):
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        remember_message(st.session_state, {"role": "user", "content": prompt})
         
         # Display user message
         with st.chat_message("user"):
@@ -787,24 +1276,59 @@ def create_streamlit_app():
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    # Check if we have summaries available
-                    has_summaries = (hasattr(rag_system, 'hierarchical_processor') and 
-                                   rag_system.hierarchical_processor.summary_collection)
+                    # The answer cache is process-wide; answers conditioned on this session's
+                    # earlier turns are neither served from it nor stored in it
+                    history_summary = st.session_state.summary_buffer
+                    response = None if history_summary else \
+                        answer_cache.lookup(prompt, query_threshold, evidence_threshold)
+                    cache_hit = response is not None
+                    quick = False
+                    if not cache_hit and query_router.enabled and \
+                            not query_router.needs_llm(rag_system.get_embedding(prompt)):
+                        # Extractive question: the top passage is the answer
+                        response = rag_system.quick_answer(prompt)
+                        quick = response is not None
                     
-                    if has_summaries:
+                    if cache_hit:
+                        st.caption("⚡ Answered from cache")
+                    elif quick:
+                        st.caption("🎯 Quick answer: top matching passage, no LLM call")
+                    elif rag_system.has_summaries:
                         # Use enhanced search with summaries
-                        response = rag_system.search_enhanced(prompt, top_k=8, use_summaries=True)
+                        response = asyncio.run(rag_system.search_top8(
+                            prompt, session_id=st.session_state.sid, stream=True,
+                            history_summary=history_summary
+                        ))
                         st.caption("🧠 Using smart summaries + detailed chunks")
+                        if response.timings:
+                            st.caption(f"🔎 Retrieval: ANN {response.timings['ann'] * 1000:.0f}ms")
                     else:
-                        # Use regular search
-                        response = rag_system.search_and_answer(prompt, top_k=8)
+                        # Use regular search. The answer cache above already gated reuse; its
+                        # rejections must not fall through to the looser, ungated query cache
+                        response = rag_system.search_and_answer(
+                            prompt, top_k=8, session_id=st.session_state.sid, stream=True,
+                            history_summary=history_summary, use_query_cache=False
+                        )
                         st.caption("📄 Using basic chunks only")
                     
-                    # Display answer
-                    st.markdown(response.answer)
+                    # Display answer, token by token when it is being generated
+                    if isinstance(response, StreamingAnswer):
+                        placeholder = st.empty()
+                        streamed = ""
+                        for token in response.iter_tokens():
+                            streamed += token
+                            placeholder.markdown(streamed + "▌")
+                        placeholder.markdown(streamed)
+                        response = response.to_response()
+                    else:
+                        st.markdown(response.answer)
+                    
+                    # Only cache grounded LLM answers; errors and "no documents" replies have no evidence
+                    if not cache_hit and not quick and not history_summary and response.evidence:
+                        answer_cache.store(prompt, response, response.evidence)
                     
                     # Add to chat history
-                    st.session_state.messages.append({
+                    remember_message(st.session_state, {
                         "role": "assistant",
                         "content": response.answer,
                         "sources": response.sources
@@ -813,19 +1337,18 @@ def create_streamlit_app():
                     # Show sources
                     if response.sources:
                         with st.expander("📚 Sources", expanded=False):
-                            for source in response.sources:
-                                if source.startswith("Summary:"):
-                                    st.markdown(f"🧠 {source}")
-                                else:
-                                    st.text(f"📄 {source}")
+                            st.markdown(format_sources(response.sources))
                     
                     # Show processing time
                     st.caption(f"⏱️ Response generated in {response.processing_time:.2f}s")
                     
                 except Exception as e:
-                    error_msg = f"Sorry, I encountered an error: {str(e)}"
+                    logger.exception("Chat turn failed")
+                    error_msg = error_answer(e)
                     st.error(error_msg)
-                    st.session_state.messages.append({
+                    if st.session_state.get("debug"):
+                        st.exception(e)
+                    remember_message(st.session_state, {
                         "role": "assistant",
                         "content": error_msg,
                         "sources": []
@@ -841,7 +1364,7 @@ def main():
             # Run FastAPI server
             import uvicorn
             logger.info("🚀 Starting FastAPI server...")
-            uvicorn.run(app, host="0.0.0.0", port=8001)
+            uvicorn.run(_build_api(), host="0.0.0.0", port=8001)
         else:
             print("Usage: python app.py [streamlit|api]")
             print("  streamlit - Run web interface (default)")
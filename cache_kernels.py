@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+cache_kernels.py
+Numeric kernels for the semantic answer cache: cosine top-1 over cached embeddings and
+Jaccard over uint64 evidence-id signatures. JIT-compiled with Numba when it is installed.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Numba is optional; without it the NumPy versions below are used
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# xxHash is much faster than hashlib for short ids; blake2b is the fallback
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+if njit is not None:
+    # cache=True keeps compiled machine code on disk, so only the first process ever compiles
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _cosine_scores(query, matrix, out):
+        for i in prange(matrix.shape[0]):
+            acc = np.float32(0.0)
+            for j in range(matrix.shape[1]):
+                acc += matrix[i, j] * query[j]
+            out[i] = acc
+
+    @njit(cache=True)
+    def _intersection_size(a, b):
+        # Merge-count over two sorted, de-duplicated arrays
+        i = j = count = 0
+        while i < a.shape[0] and j < b.shape[0]:
+            x, y = a[i], b[j]
+            count += x == y
+            i += x <= y
+            j += y <= x
+        return count
+else:
+    def _cosine_scores(query, matrix, out):
+        np.matmul(matrix, query, out=out)
+
+    def _intersection_size(a, b):
+        return np.intersect1d(a, b, assume_unique=True).shape[0]
+
+def cosine_top1(query: np.ndarray, matrix: np.ndarray) -> Tuple[int, float]:
+    """Row index and score of the best match for a unit query against unit-normalized rows"""
+    scores = np.empty(matrix.shape[0], dtype=np.float32)
+    _cosine_scores(query, matrix, scores)
+    best = int(np.argmax(scores))
+    return best, float(scores[best])
+
+if xxhash is not None:
+    def _hash_id(chunk_id: str) -> int:
+        return xxhash.xxh64_intdigest(chunk_id)
+else:
+    def _hash_id(chunk_id: str) -> int:
+        return int.from_bytes(hashlib.blake2b(chunk_id.encode(), digest_size=8).digest(), "little")
+
+def evidence_signature(evidence: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted uint64 hashes of the evidence ids (8 bytes per id), for jaccard(), and their versions in the same order"""
+    hashes = np.fromiter(map(_hash_id, evidence), dtype=np.uint64, count=len(evidence))
+    versions = np.fromiter(evidence.values(), dtype=np.int64, count=len(evidence))
+    order = np.argsort(hashes)
+    return hashes[order], versions[order]
+
+def versions_changed(a: np.ndarray, a_versions: np.ndarray, b: np.ndarray, b_versions: np.ndarray) -> bool:
+    """Whether any id present in both signatures has a different version in each"""
+    _, in_a, in_b = np.intersect1d(a, b, assume_unique=True, return_indices=True)
+    return bool(np.any(a_versions[in_a] != b_versions[in_b]))
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two id signatures"""
+    inter = _intersection_size(a, b)
+    union = a.shape[0] + b.shape[0] - inter
+    return inter / union if union else 0.0
+
+def warmup(dim: int = 1536) -> None:
+    """Compile (or load the cached build of) the kernels now, so the first user turn doesn't wait"""
+    if njit is None:
+        return
+    if os.getenv("NUMBA_DISABLE_JIT") == "1":
+        logger.warning("⚠️ NUMBA_DISABLE_JIT is set: cache kernels run as slow pure Python")
+        return
+    cosine_top1(np.zeros(dim, dtype=np.float32), np.zeros((1, dim), dtype=np.float32))
+    jaccard(np.zeros(1, dtype=np.uint64), np.zeros(1, dtype=np.uint64))
+    logger.info("✅ Cache kernels compiled")
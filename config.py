@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+config.py
+System configuration from environment variables, shared by app.py and hierarchical_processor.py
+"""
+
+import os
+
+class Config:
+    """System configuration from environment variables"""
+    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID", "")
+    AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
+    AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "")
+    CHROMA_HOST: str = os.getenv("CHROMA_HOST", "localhost")
+    CHROMA_PORT: int = int(os.getenv("CHROMA_PORT", "8002"))
+    EMBEDDING_CACHE_DB: str = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.db")
+    # In-memory LRU size in front of the SQLite layer (~6KB per 1536-dim float32 vector)
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+    DOCUMENT_STORE_DB: str = os.getenv("DOCUMENT_STORE_DB", "documents.db")
+    ANSWER_CACHE_DB: str = os.getenv("ANSWER_CACHE_DB", ".llm_cache.db")
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "604800"))  # 7 days
+    QUERY_ROUTER_MODEL: str = os.getenv("QUERY_ROUTER_MODEL", "clf.pkl")
+    # Optional OpenAI-compatible server (e.g. vLLM with --enable-prefix-caching) for chat answers
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "")
+    CHAT_MODEL: str = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+    
+    @property
+    def s3_enabled(self) -> bool:
+        return bool(self.S3_BUCKET and self.AWS_ACCESS_KEY_ID and self.AWS_SECRET_ACCESS_KEY)
+    
+    @property
+    def openai_enabled(self) -> bool:
+        return bool(self.OPENAI_API_KEY and self.OPENAI_API_KEY.startswith("sk-"))
+
+config = Config()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+document_store.py
+Compressed full-text storage for uploaded documents, backed by SQLite
+"""
+
+import logging
+import sqlite3
+import threading
+import zlib
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class OriginalTextStore:
+    """Stores each document's full extracted text, keyed by filename"""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS original_texts ("
+            "filename TEXT PRIMARY KEY, text BLOB NOT NULL, char_count INTEGER, word_count INTEGER)"
+        )
+        self._db.commit()
+
+    def save(self, filename: str, text: str, char_count: int, word_count: int) -> None:
+        """Store (or replace) a document's text, zlib-compressed"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO original_texts (filename, text, char_count, word_count) VALUES (?, ?, ?, ?)",
+                (filename, zlib.compress(text.encode('utf-8')), char_count, word_count)
+            )
+            self._db.commit()
+
+    def get(self, filename: str) -> Optional[str]:
+        """Return a document's text, or None if it was never stored"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text FROM original_texts WHERE filename = ?", (filename,)
+            ).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+embedding_batcher.py
+Coalesces single-text embedding requests from concurrent sessions into one batched API call
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """Embeds every text queued at the time (up to max_batch) in a single request
+
+    A lone request goes out at once; texts that arrive while a call is in flight wait for it
+    and share the next one, so batches grow only under concurrent load.
+
+    Runs on its own worker thread and hands back concurrent.futures.Future objects, so it works
+    from any caller: Streamlit script threads, FastAPI handlers, or coroutines via
+    asyncio.wrap_future, each of which may be on a different event loop.
+    """
+
+    # One batcher per name for the whole process (Streamlit re-runs the app script, not imports)
+    _shared: Dict[str, "EmbeddingBatcher"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, embed_many: Callable[[List[str]], List[List[float]]],
+                 max_batch: int = 32):
+        self.embed_many = embed_many
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, name: str, embed_many: Callable[[List[str]], List[List[float]]], **kwargs) -> "EmbeddingBatcher":
+        """Return the process-wide batcher for name, creating it on first use"""
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls(embed_many, **kwargs)
+            return cls._shared[name]
+
+    def submit(self, text: str) -> Future:
+        """Queue text for embedding; the future resolves to its embedding"""
+        with self._start_lock:
+            # (Re)start the worker; a dead one would leave every queued future pending forever
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _next_batch(self) -> List[tuple]:
+        # Block for the first text, then take whatever else is already waiting; never wait for more
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = [(text, future) for text, future in self._next_batch()
+                     if future.set_running_or_notify_cancel()]
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch: List[tuple]) -> None:
+        """Embed one batch and resolve its futures; any failure fails the batch, never the worker"""
+        try:
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            embeddings = self.embed_many(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            by_text = dict(zip(texts, embeddings))
+
+            if len(batch) > 1:
+                logger.info(f"📦 Coalesced {len(batch)} embedding requests into one call")
+            for text, future in batch:
+                future.set_result(by_text[text])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+embedding_cache.py
+Content-addressed embedding cache: in-process LRU backed by SQLite
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Caches embeddings keyed by a hash of the exact text that was embedded"""
+
+    def __init__(self, db_path: Optional[str] = None, max_memory_entries: int = 4096):
+        self.max_memory_entries = max_memory_entries
+        # float32 vectors: a quarter of the memory of Python float lists
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Persistent layer is optional - the cache still works in memory without it
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, embedding BLOB NOT NULL)"
+                )
+                self._db.commit()
+                logger.info(f"✅ Embedding cache opened at {db_path}")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Embedding cache disk layer unavailable, using memory only: {e}")
+                self._db = None
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Hash text into a 16-byte cache key"""
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def _remember(self, key: bytes, embedding: np.ndarray) -> None:
+        """Insert into the in-memory LRU, evicting the oldest entry if full"""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up float32 embeddings for texts; misses come back as None"""
+        keys = [self.key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        disk_lookups = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = embedding
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+
+            if disk_lookups and self._db is not None:
+                try:
+                    missing = list(disk_lookups)
+                    # Stay under SQLite's bound-parameter limit
+                    for start in range(0, len(missing), 500):
+                        batch = missing[start:start + 500]
+                        rows = self._db.execute(
+                            f"SELECT hash, embedding FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                            batch
+                        ).fetchall()
+                        for key, blob in rows:
+                            embedding = np.frombuffer(blob, dtype=np.float32)
+                            self._remember(key, embedding)
+                            for i in disk_lookups[key]:
+                                results[i] = embedding
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Embedding cache read failed: {e}")
+
+        return results
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Look up a single embedding"""
+        return self.get_many([text])[0]
+
+    def put_many(self, texts: List[str], embeddings) -> None:
+        """Store embeddings (rows of an array or float lists) in memory and on disk"""
+        keys = [self.key(text) for text in texts]
+        # Copy each row so cached vectors don't keep a caller's whole batch array alive
+        vectors = [np.array(embedding, dtype=np.float32) for embedding in embeddings]
+
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+
+            if self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (hash, embedding) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in zip(keys, vectors)]
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+    def put(self, text: str, embedding: List[float]) -> None:
+        """Store a single embedding"""
+        self.put_many([text], [embedding])
@@ -259,7 +259,7 @@ class EnhancedRAGSystem:
         
         try:
             # Extract text (reuse existing method)
-            text = self.base_system.extract_text(file_content, filename)
+            text = self.base_system.extract_text(file_content, filename).text
             if not text.strip():
                 return DocumentResponse(
                     status="error",
@@ -5,15 +5,62 @@ Enhanced RAG processing with logical grouping and 10:1 compression summaries
 """
 
 import asyncio
+import os
 import time
 import re
 import logging
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
-import nltk
+
+from config import config
+from schemas import ChatResponse, StreamingAnswer
 
 logger = logging.getLogger(__name__)
 
+# Static prompt text first and byte-identical across calls (system message, then the fixed
+# head of the user message), so repeated summarization calls share a cacheable prefix
+COMPRESSION_SYSTEM_PROMPT = (
+    "You are an expert at creating short summaries that preserve essential information for search."
+)
+COMPRESSION_INSTRUCTIONS = """Compress the original text below while preserving key information and searchable content.
+
+Requirements:
+- Keep proper names, character names, and important details
+- Preserve the main topic and key events
+- Make it useful for search and retrieval
+- Use exactly the target number of words
+"""
+SUMMARY_SEARCH_SYSTEM_PROMPT = (
+    "Use both detailed chunks and logical summaries to provide comprehensive answers. "
+    "Summaries give broader context, chunks provide specific details."
+)
+
+# NLTK data is checked on first use, at most once per process
+_NLTK_READY = False
+
+def ensure_nltk_data() -> None:
+    """Download the NLTK tokenizer data if it is missing"""
+    global _NLTK_READY
+    if _NLTK_READY:
+        return
+    
+    import nltk
+    # Data baked into the image at NLTK_DATA needs no runtime probing
+    if not os.getenv("NLTK_DATA"):
+        # Updated for NLTK 3.9.1; punkt kept for backward compatibility
+        for resource, package in [
+            ('tokenizers/punkt_tab', 'punkt_tab'),
+            ('tokenizers/punkt', 'punkt'),
+            ('corpora/stopwords', 'stopwords')
+        ]:
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                print(f"Downloading NLTK {package} data...")
+                nltk.download(package)
+    
+    _NLTK_READY = True
+
 @dataclass
 class LogicalGroup:
     """A group of sentences that represent a single logical idea"""
@@ -23,6 +70,7 @@ class LogicalGroup:
     topic_indicators: List[str]
     word_count: int
     coherence_score: float
+    group_index: int  # Position in the document; group_id's string form doesn't sort numerically
 
 @dataclass
 class CompressedGroup:
@@ -61,6 +109,8 @@ class SemanticSentenceGrouper:
     
     def split_into_sentences(self, text: str) -> List[str]:
         """Split text into clean sentences"""
+        ensure_nltk_data()
+        import nltk
         sentences = nltk.sent_tokenize(text)
         clean_sentences = []
         
@@ -161,7 +211,8 @@ class SemanticSentenceGrouper:
             combined_text=combined_text,
             topic_indicators=[],  # Could be enhanced
             word_count=word_count,
-            coherence_score=coherence_score
+            coherence_score=coherence_score,
+            group_index=group_index
         )
     
     def process_text_into_groups(self, text: str) -> List[LogicalGroup]:
@@ -225,29 +276,19 @@ class AdaptiveCompressor:
         strategy = self.choose_compression_strategy(group.combined_text, group.word_count)
         target_length = self.calculate_target_length(group.word_count, strategy)
         
-        prompt = f"""
-        Compress this text to exactly {target_length} words while preserving key information and searchable content.
-
-        Requirements:
-        - Target: {target_length} words (10:1 compression from {group.word_count} words)
-        - Keep proper names, character names, and important details
-        - Preserve the main topic and key events
-        - Make it useful for search and retrieval
-
-        Original text:
-        {group.combined_text}
-
-        Compressed summary ({target_length} words):"""
+        prompt = (
+            f"{COMPRESSION_INSTRUCTIONS}\n"
+            f"Target: {target_length} words (10:1 compression from {group.word_count} words)\n\n"
+            f"Original text:\n{group.combined_text}\n\n"
+            f"Compressed summary ({target_length} words):"
+        )
         
         try:
             response = await asyncio.to_thread(
                 self.openai_client.chat.completions.create,
                 model="gpt-3.5-turbo",
                 messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are an expert at creating {target_length}-word summaries that preserve essential information for search."
-                    },
+                    {"role": "system", "content": COMPRESSION_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
@@ -292,7 +333,8 @@ class HierarchicalProcessor:
         try:
             self.summary_collection = self.rag_system.chroma_client.get_or_create_collection(
                 name="logical_summaries",
-                metadata={"description": "10:1 compressed summaries of logical groups"}
+                metadata={"description": "10:1 compressed summaries of logical groups",
+                          **self.rag_system.HNSW_METADATA}
             )
         except Exception as e:
             logger.error(f"Failed to create summary collection: {e}")
@@ -305,7 +347,7 @@ class HierarchicalProcessor:
         try:
             logger.info(f"🧠 Starting hierarchical processing for: {filename}")
             
-            # Get the original document text from ChromaDB
+            # Get the original document text
             text = await self.get_document_text(filename)
             if not text:
                 return HierarchicalResult(
@@ -376,7 +418,11 @@ class HierarchicalProcessor:
             )
     
     async def get_document_text(self, filename: str) -> Optional[str]:
-        """Retrieve original document text from ChromaDB chunks"""
+        """Retrieve original document text, rebuilding it from ChromaDB chunks if it wasn't stored"""
+        text = self.rag_system.get_original_text(filename)
+        if text:
+            return text
+        
         try:
             # Query all chunks for this document using get() instead of query()
             results = self.rag_system.collection.get(
@@ -410,24 +456,28 @@ class HierarchicalProcessor:
             return 0
         
         stored_count = 0
+        version = int(time.time())  # Lets cached answers detect re-generated summaries
         
         try:
             for compressed in compressed_groups:
                 # Generate embedding for summary
                 embedding = self.rag_system.get_embedding(compressed.summary)
                 
-                self.summary_collection.add(
+                # Upsert: Chroma ignores add for ids that already exist, so re-runs would keep old rows
+                self.summary_collection.upsert(
                     ids=[f"{filename}_{compressed.original_group.group_id}"],
                     embeddings=[embedding],
                     documents=[compressed.summary],
                     metadatas=[{
                         "filename": filename,
                         "group_id": compressed.original_group.group_id,
+                        "group_index": compressed.original_group.group_index,
                         "content_type": "logical_summary",
                         "original_words": compressed.original_group.word_count,
                         "summary_words": len(compressed.summary.split()),
                         "compression_ratio": compressed.compression_ratio,
-                        "strategy_used": compressed.strategy_used
+                        "strategy_used": compressed.strategy_used,
+                        "version": version
                     }]
                 )
                 stored_count += 1
@@ -435,60 +485,119 @@ class HierarchicalProcessor:
         except Exception as e:
             logger.error(f"Failed to store summaries: {e}")
         
+        if stored_count:
+            # Groups from an earlier run that this run did not overwrite
+            try:
+                self.summary_collection.delete(where={"$and": [
+                    {"filename": filename}, {"version": {"$ne": version}}
+                ]})
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to remove stale summaries of {filename}: {e}")
+            self.rag_system.invalidate_has_summaries()
         return stored_count
     
-    def search_with_summaries(self, query: str, top_k_summaries: int = 5, top_k_chunks: int = 3):
-        """Search using both summaries and original chunks"""
-        
-        # Get original chunk search
-        chunk_response = self.rag_system.search_and_answer(query, top_k_chunks)
-        
+    async def _query_summaries(self, query_embedding: List[float], top_k: int):
+        """Search the summary collection; a failure only means answering from chunks alone"""
+        try:
+            return await asyncio.to_thread(
+                self.rag_system.vector_search, self.summary_collection, query_embedding, top_k
+            )
+        except Exception as e:
+            logger.warning(f"Summary search failed: {e}")
+            return None, 0.0
+
+    async def search_with_summaries(self, query: str, top_k_summaries: int = 4, top_k_chunks: int = 8,
+                                    session_id: Optional[str] = None, stream: bool = False,
+                                    history_summary: Optional[str] = None):
+        """Search summaries and original chunks concurrently, then answer with one LLM call
+        
+        Only the chat UI calls this, behind its evidence-gated answer cache, so the chunk-only
+        fallbacks bypass the ungated query cache.
+        """
         if not self.summary_collection:
-            return chunk_response
+            return await asyncio.to_thread(
+                self.rag_system.search_and_answer, query, top_k_chunks,
+                session_id=session_id, stream=stream, history_summary=history_summary,
+                use_query_cache=False
+            )
         
+        start_time = time.time()
         try:
-            # Search summaries
-            query_embedding = self.rag_system.get_embedding(query)
-            summary_results = self.summary_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k_summaries
+            # Embedding is cached, so a repeated query skips the API round-trip
+            query_embedding = await self.rag_system.get_query_embedding(query)
+            
+            # Both vector store round-trips overlap
+            (chunk_results, chunk_ann), (summary_results, summary_ann) = await asyncio.gather(
+                asyncio.to_thread(
+                    self.rag_system.vector_search, self.rag_system.collection, query_embedding, top_k_chunks
+                ),
+                self._query_summaries(query_embedding, top_k_summaries)
             )
+            timings = {"ann": max(chunk_ann, summary_ann)}
             
-            if summary_results['documents'][0]:
-                # Combine contexts
-                chunk_context = "\n\n".join(chunk_response.sources)
-                summary_context = "\n\n".join([
-                    f"Summary: {doc}" for doc in summary_results['documents'][0]
-                ])
-                
-                combined_context = f"Detailed Chunks:\n{chunk_context}\n\nLogical Summaries:\n{summary_context}"
-                
-                # Generate enhanced answer
-                response = self.rag_system.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "Use both detailed chunks and logical summaries to provide comprehensive answers. Summaries give broader context, chunks provide specific details."
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Context:\n{combined_context}\n\nQuestion: {query}\n\nAnswer:"
-                        }
-                    ],
-                    temperature=0.1,
-                    max_tokens=1000
-                )
-                
-                # Return enhanced response
-                from app import ChatResponse
+            if not chunk_results['documents'][0]:
                 return ChatResponse(
-                    answer=response.choices[0].message.content,
-                    sources=chunk_response.sources + [f"Summary: {meta['filename']}" for meta in summary_results['metadatas'][0]],
-                    processing_time=chunk_response.processing_time
+                    answer="No relevant documents found. Please upload some documents first.",
+                    sources=[],
+                    processing_time=time.time() - start_time
                 )
+            
+            selected = self.rag_system.select_context(chunk_results['documents'][0])
+            # Blocks go into the prompt in canonical order; sources stay in relevance order
+            chunk_context = self.rag_system.context_blocks(chunk_results, selected)
+            sources = list(dict.fromkeys(chunk_results['metadatas'][0][i]["filename"] for i in selected))
+            
+            combined_context = f"Detailed Chunks:\n{chunk_context}"
+            if summary_results and summary_results['documents'][0]:
+                summary_context = self.rag_system.context_blocks(
+                    summary_results, range(len(summary_results['documents'][0])), position_field="group_index"
+                )
+                combined_context += f"\n\nLogical Summaries:\n{summary_context}"
+                sources += [f"Summary: {meta['filename']}" for meta in summary_results['metadatas'][0]]
+            
+            # Exactly the blocks placed in the prompt, for the answer cache's evidence gate
+            evidence = self.rag_system.result_evidence(chunk_results, selected)
+            if summary_results:
+                evidence.update(self.rag_system.result_evidence(summary_results))
+            
+            request = dict(
+                model=config.CHAT_MODEL,
+                messages=self.rag_system.answer_messages(
+                    SUMMARY_SEARCH_SYSTEM_PROMPT, combined_context, query, history_summary
+                ),
+                temperature=0.1,
+                max_tokens=1000,
+                extra_headers=self.rag_system.session_headers(session_id)
+            )
+            
+            if stream:
+                # A sync stream, so the caller can keep reading it after this event loop has finished
+                chunks = await asyncio.to_thread(
+                    self.rag_system.chat_client.chat.completions.create, stream=True, **request
+                )
+                return StreamingAnswer(chunks=chunks, sources=sources, start_time=start_time,
+                                       timings=timings, evidence=evidence)
+            
+            # Sync client on a worker thread: an async client would outlive the loop it was first used on
+            response = await asyncio.to_thread(self.rag_system.chat_client.chat.completions.create, **request)
+            
+            processing_time = time.time() - start_time
+            logger.info(f"💬 Generated summary-enhanced answer in {processing_time:.2f}s")
+            
+            return ChatResponse(
+                answer=response.choices[0].message.content,
+                sources=sources,
+                processing_time=processing_time,
+                timings=timings,
+                evidence=evidence
+            )
         
         except Exception as e:
-            logger.warning(f"Summary search failed: {e}")
+            logger.warning(f"Summary-enhanced search failed ({type(e).__name__}), falling back to chunks",
+                           exc_info=True)
         
-        return chunk_response
+        return await asyncio.to_thread(
+            self.rag_system.search_and_answer, query, top_k_chunks,
+            session_id=session_id, stream=stream, history_summary=history_summary,
+            use_query_cache=False
+        )
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+pdf_extraction.py
+Page-range PDF text extraction, kept import-light so process-pool workers can load it cheaply
+(PyPDF2 is only imported when PDFium is unavailable)
+"""
+
+import io
+import logging
+from typing import BinaryIO, List, Optional, Union
+
+# PDFium (C++) text extraction is much faster than PyPDF2; fall back when unavailable
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# Raw bytes, or a seekable file object (e.g. an upload's SpooledTemporaryFile) read in place
+PdfSource = Union[bytes, BinaryIO]
+
+def _rewind(source: PdfSource) -> PdfSource:
+    if not isinstance(source, bytes):
+        source.seek(0)
+    return source
+
+def _open_pypdf2(source: PdfSource):
+    import PyPDF2
+    return PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else _rewind(source))
+
+def count_pdf_pages(source: PdfSource) -> int:
+    """Return the number of pages in a PDF"""
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(_rewind(source))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    return len(_open_pypdf2(source).pages)
+
+def extract_pdf_page_range(source: PdfSource, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """Extract text for pages [start, end), one string per page"""
+    pages = []
+
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(_rewind(source))
+        try:
+            stop = len(pdf) if end is None else min(end, len(pdf))
+            for page_num in range(start, stop):
+                try:
+                    page = pdf[page_num]
+                    textpage = page.get_textpage()
+                    pages.append(textpage.get_text_bounded())
+                    textpage.close()
+                    page.close()
+                except Exception as e:
+                    logger.warning(f"Failed to extract text from page {page_num}: {e}")
+        finally:
+            pdf.close()
+        return pages
+
+    # Pure Python fallback
+    reader = _open_pypdf2(source)
+    stop = len(reader.pages) if end is None else min(end, len(reader.pages))
+    for page_num in range(start, stop):
+        try:
+            pages.append(reader.pages[page_num].extract_text())
+        except Exception as e:
+            logger.warning(f"Failed to extract text from page {page_num}: {e}")
+    return pages
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+query_cache.py
+Semantic query-response cache stored in a ChromaDB collection
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class QueryCache:
+    """Returns a previous answer when a new query embeds close enough to a cached one"""
+
+    def __init__(self, chroma_client, similarity_threshold: float = 0.92,
+                 ttl_seconds: float = 3600, max_entries: int = 10000):
+        self.chroma_client = chroma_client
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # Entry id -> timestamp, oldest first, for LRU eviction; read from the collection on first store
+        self._lru: "OrderedDict[str, float]" = OrderedDict()
+        self._lru_loaded = False
+        self._lock = threading.Lock()
+
+        try:
+            self.collection = self.chroma_client.get_or_create_collection(
+                name="query_cache",
+                metadata={"description": "Cached answers keyed by query embedding", "hnsw:space": "cosine"}
+            )
+            logger.info("✅ Query cache ready")
+        except Exception as e:
+            logger.error(f"Failed to create query cache collection: {e}")
+            self.collection = None
+
+    def _load_lru(self) -> None:
+        """Order the entries already in the collection by age; only eviction needs this"""
+        existing = self.collection.get(include=["metadatas"])
+        entries = sorted(zip(existing['ids'], existing['metadatas']), key=lambda x: x[1].get('timestamp', 0))
+        with self._lock:
+            for entry_id, meta in entries:
+                self._lru[entry_id] = meta.get('timestamp', 0)
+            self._lru_loaded = True
+
+    def lookup(self, query_embedding: List[float], top_k: int) -> Optional[Tuple[str, List[str]]]:
+        """Return (answer, sources) for a semantically matching fresh entry, or None"""
+        if not self.collection:
+            return None
+
+        try:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=1,
+                where={"top_k": top_k}
+            )
+            if not results['ids'][0]:
+                return None
+
+            entry_id = results['ids'][0][0]
+            meta = results['metadatas'][0][0]
+            similarity = 1.0 - results['distances'][0][0]  # cosine distance -> similarity
+            if similarity < self.similarity_threshold:
+                return None
+
+            if time.time() - meta['timestamp'] > self.ttl_seconds:
+                self._delete([entry_id])
+                return None
+
+            with self._lock:
+                if entry_id in self._lru:
+                    self._lru.move_to_end(entry_id)
+
+            logger.info(f"⚡ Query cache hit (similarity {similarity:.3f})")
+            return results['documents'][0][0], json.loads(meta['sources'])
+
+        except Exception as e:
+            logger.warning(f"⚠️ Query cache lookup failed: {e}")
+            return None
+
+    def store(self, query: str, query_embedding: List[float], top_k: int,
+              answer: str, sources: List[str]) -> None:
+        """Cache an answer and evict the least recently used entries beyond max_entries"""
+        if not self.collection:
+            return
+
+        entry_id = uuid.uuid4().hex
+        timestamp = time.time()
+        try:
+            if not self._lru_loaded:
+                self._load_lru()
+            self.collection.add(
+                ids=[entry_id],
+                embeddings=[query_embedding],
+                documents=[answer],
+                metadatas=[{
+                    "query": query,
+                    "top_k": top_k,
+                    "sources": json.dumps(sources),
+                    "timestamp": timestamp
+                }]
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Query cache store failed: {e}")
+            return
+
+        with self._lock:
+            self._lru[entry_id] = timestamp
+            evicted = []
+            while len(self._lru) > self.max_entries:
+                evicted.append(self._lru.popitem(last=False)[0])
+        if evicted:
+            self._delete(evicted)
+
+    def _delete(self, entry_ids: List[str]) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                self._lru.pop(entry_id, None)
+        try:
+            self.collection.delete(ids=entry_ids)
+        except Exception as e:
+            logger.warning(f"⚠️ Query cache eviction failed: {e}")
+
+    def clear(self) -> None:
+        """Drop every cached answer, e.g. after the document corpus changes"""
+        if not self.collection:
+            return
+
+        try:
+            # Delete the entries but keep the collection: other QueryCache instances hold its handle
+            self.collection.delete(where={"timestamp": {"$gte": 0}})
+            with self._lock:
+                self._lru.clear()
+            logger.info("🧹 Query cache cleared")
+        except Exception as e:
+            logger.warning(f"⚠️ Query cache clear failed: {e}")
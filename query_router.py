@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+query_router.py
+Micro-classifier over query embeddings: decides whether a question needs LLM generation
+or can be answered by returning the top retrieved passage directly
+"""
+
+import logging
+import os
+import pickle
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class QueryRouter:
+    """Wraps a pickled classifier whose predict_proba(...)[:, 1] is P(needs_llm)
+
+    Without a model file every query goes to the LLM, so routing is strictly opt-in.
+    """
+
+    def __init__(self, model_path: Optional[str] = "clf.pkl", threshold: float = 0.5):
+        self.threshold = threshold
+        self.model = None
+        if model_path and os.path.exists(model_path):
+            try:
+                # Only load a model file you trained yourself: unpickling runs arbitrary code
+                with open(model_path, "rb") as f:
+                    self.model = pickle.load(f)
+                logger.info(f"✅ Query router loaded from {model_path}")
+            except Exception as e:
+                logger.warning(f"⚠️ Query router unavailable, sending every query to the LLM: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    def needs_llm(self, query_embedding: List[float]) -> bool:
+        """True unless the classifier is confident the top passage alone answers the query"""
+        if self.model is None:
+            return True
+        try:
+            features = np.asarray(query_embedding, dtype=np.float32)[np.newaxis, :]
+            return bool(self.model.predict_proba(features)[0, 1] > self.threshold)
+        except Exception as e:
+            logger.warning(f"⚠️ Query routing failed, using the LLM: {e}")
+            return True
+
+    @staticmethod
+    def train(query_embeddings: np.ndarray, needs_llm: np.ndarray, model_path: str = "clf.pkl") -> None:
+        """Fit a logistic regression on logged (query embedding, needed the LLM) pairs and save it"""
+        from sklearn.linear_model import LogisticRegression
+        model = LogisticRegression(max_iter=1000)
+        model.fit(np.asarray(query_embeddings, dtype=np.float32), np.asarray(needs_llm, dtype=bool))
+        with open(model_path, "wb") as f:
+            pickle.dump(model, f)
+        logger.info(f"✅ Query router trained on {len(needs_llm)} queries, saved to {model_path}")
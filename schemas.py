@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+schemas.py
+Request/response models shared by app.py and hierarchical_processor.py (kept out of app.py so
+`streamlit run app.py`, which runs it as __main__, and its importers see the same classes)
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+class ChatRequest(BaseModel):
+    query: str
+    top_k: int = 15 
+
+class ChatResponse(BaseModel):
+    answer: str
+    sources: List[str]
+    processing_time: float
+    timings: Dict[str, float] = {}
+    # Ids and versions of the retrieved blocks the answer was generated from (not serialized)
+    evidence: Dict[str, int] = Field(default_factory=dict, exclude=True)
+
+@dataclass
+class StreamingAnswer:
+    """An answer whose text arrives token by token; sources are known before generation starts"""
+    chunks: Iterator  # OpenAI chat.completions stream
+    sources: List[str]
+    start_time: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    evidence: Dict[str, int] = field(default_factory=dict)
+    on_complete: Optional[Callable[[str], None]] = None
+    answer: str = ""
+    processing_time: float = 0.0
+
+    def iter_tokens(self) -> Iterator[str]:
+        """Yield answer text as it is generated; answer and processing_time are set once exhausted"""
+        parts = []
+        for chunk in self.chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+        self.answer = "".join(parts)
+        self.processing_time = time.time() - self.start_time
+        logger.info(f"💬 Streamed answer in {self.processing_time:.2f}s")
+        if self.on_complete:
+            self.on_complete(self.answer)
+
+    def to_response(self) -> "ChatResponse":
+        return ChatResponse(answer=self.answer, sources=self.sources,
+                            processing_time=self.processing_time, timings=self.timings,
+                            evidence=self.evidence)
+
+class DocumentResponse(BaseModel):
+    status: str
+    message: str
+    chunks_created: int = 0
+    processing_time: float = 0.0
+    # (chunk_index, error) for chunks that could not be stored
+    failed_chunks: List[Tuple[int, str]] = []
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Tests for the answer cache's large-cache paths (TTL sweep, 8-bit quantization, LSH), with the
+thresholds lowered so a handful of entries reaches them"""
+
+import types
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import CacheTable, SemanticAnswerCache
+from schemas import ChatResponse
+
+DIM = 16
+TTL = 60.0
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+# Well-separated base prompts, plus one close paraphrase of each (cosine > 0.99)
+_rng = np.random.default_rng(7)
+BASE = {f"q{i}": unit(_rng.standard_normal(DIM)) for i in range(6)}
+PARAPHRASES = {f"{prompt} reworded": unit(vector + 0.02 * _rng.standard_normal(DIM))
+               for prompt, vector in BASE.items()}
+VECTORS = {**BASE, **PARAPHRASES}
+EVIDENCE = {"doc.txt_0": 1, "doc.txt_1": 1}
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() as seen by answer_cache"""
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def make_cache(**overrides) -> SemanticAnswerCache:
+    cache = SemanticAnswerCache(lambda prompt: VECTORS[prompt].tolist(), lambda embedding: dict(EVIDENCE),
+                                ChatResponse, db_path=None, ttl_seconds=TTL)
+    for name, value in overrides.items():
+        setattr(cache, name, value)
+    return cache
+
+def answer_for(prompt: str) -> ChatResponse:
+    return ChatResponse(answer=f"answer to {prompt}", sources=["doc.txt"], processing_time=0.1)
+
+def assert_aligned(cache: SemanticAnswerCache) -> None:
+    """Every key maps to the row holding its own embedding and response"""
+    table = cache._table
+    assert cache._rows == {key: row for row, key in enumerate(table.keys)}
+    assert len(table.responses) == len(table.signatures) == len(table.versions) == table.size
+    for row, response in enumerate(table.responses):
+        prompt = response["answer"].removeprefix("answer to ")
+        assert table.keys[row] == SemanticAnswerCache.key(prompt)
+        np.testing.assert_allclose(table.embeddings[row], VECTORS[prompt], rtol=1e-6)
+
+def test_keep_preserves_row_alignment():
+    table = CacheTable()
+    for i, prompt in enumerate(BASE):
+        table.append(prompt, VECTORS[prompt], float(i), {"answer": prompt}, {f"{prompt}_chunk": i})
+
+    table.keep(np.array([1, 3, 4]))
+
+    assert table.size == 3
+    assert table.keys == ["q1", "q3", "q4"]
+    assert [response["answer"] for response in table.responses] == ["q1", "q3", "q4"]
+    np.testing.assert_array_equal(table.created[:3], [1.0, 3.0, 4.0])
+    np.testing.assert_array_equal(table.matrix, np.stack([VECTORS[p] for p in ("q1", "q3", "q4")]))
+    assert [int(v[0]) for v in table.versions] == [1, 3, 4]
+
+def test_expired_rows_are_never_served(clock):
+    cache = make_cache(SWEEP_EVERY=1000)  # No sweep: expired rows stay in the table
+    cache.store("q0", answer_for("q0"), EVIDENCE)
+    assert cache.lookup("q0") is not None
+
+    clock[0] += TTL + 1
+    assert cache._table.size == 1
+    assert cache.lookup("q0") is None
+    assert cache.lookup("q0 reworded") is None
+
+def fill_and_sweep(cache: SemanticAnswerCache, clock) -> None:
+    """Store q0-q1, let them expire, then store q2-q5; the fourth store since the start sweeps"""
+    for prompt in ("q0", "q1"):
+        cache.store(prompt, answer_for(prompt), EVIDENCE)
+    clock[0] += TTL + 1
+    for prompt in ("q2", "q3"):
+        cache.store(prompt, answer_for(prompt), EVIDENCE)
+    assert cache._table.size == 2  # Swept on the 4th store
+    for prompt in ("q4", "q5"):
+        cache.store(prompt, answer_for(prompt), EVIDENCE)
+
+def assert_hits_survive(cache: SemanticAnswerCache) -> None:
+    assert_aligned(cache)
+    assert [cache.lookup(p) for p in ("q0", "q1", "q0 reworded")] == [None, None, None]
+    for prompt in ("q2", "q3", "q4", "q5"):
+        assert cache.lookup(prompt).answer == f"answer to {prompt}"
+        assert cache.lookup(f"{prompt} reworded").answer == f"answer to {prompt}"
+
+def test_sweep_keeps_exact_and_paraphrase_hits(clock):
+    cache = make_cache(SWEEP_EVERY=4)
+    fill_and_sweep(cache, clock)
+    assert_hits_survive(cache)
+
+def test_sweep_rebuilds_quantized_index(clock):
+    pytest.importorskip("faiss")
+    cache = make_cache(SWEEP_EVERY=4, QUANTIZE_AFTER=2)
+    fill_and_sweep(cache, clock)
+    assert cache._quantized
+    assert cache._index.ntotal == cache._table.size
+    assert_hits_survive(cache)
+
+def test_sweep_rebuilds_lsh_buckets(clock):
+    cache = make_cache(SWEEP_EVERY=4, LSH_AFTER=1)
+    fill_and_sweep(cache, clock)
+    # Buckets hold only the compacted row numbers
+    rows = {row for bucket in cache._lsh._buckets.values() for row in bucket}
+    assert rows == set(range(cache._table.size))
+    assert_hits_survive(cache)
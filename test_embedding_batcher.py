@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""Tests for the embedding batcher's failure handling: a bad batch fails its callers, not the worker"""
+
+import pytest
+
+from embedding_batcher import EmbeddingBatcher
+
+def test_short_result_fails_the_batch_and_keeps_the_worker():
+    results = [[]]
+    batcher = EmbeddingBatcher(lambda texts: results.pop(0) if results else [[1.0]] * len(texts))
+
+    with pytest.raises(ValueError):
+        batcher.submit("x").result(timeout=1)
+
+    assert batcher.submit("y").result(timeout=1) == [1.0]
+    assert batcher._worker.is_alive()
+
+def test_embed_errors_reach_every_caller():
+    def fail(texts):
+        raise RuntimeError("API down")
+
+    batcher = EmbeddingBatcher(fail)
+    futures = [batcher.submit(text) for text in ("a", "b", "a")]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=1)